@@ -0,0 +1,330 @@
+"""Load tests and micro-benchmarks for the API hot paths.
+
+Seeds a throwaway SQLite database, then drives each scenario either in process
+through the ASGI app (`--mode asgi`) or against a real uvicorn server over HTTP
+(`--mode server`) with `--concurrency` parallel clients. Results are printed and
+written as JSON; `--baseline` compares them against an earlier run and exits
+non-zero when a scenario regressed by more than `--tolerance`.
+
+    python -m benchmarks.bench --users 5 --todos 2000 --requests 300 --output bench.json
+    python -m benchmarks.bench --mode server --concurrency 32 --baseline bench.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PASSWORD = "benchmark-password"
+LIST_SIZES = (10, 50, 200)
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not samples:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(samples)))
+    return samples[min(rank, len(samples)) - 1]
+
+
+def summarise(latencies: list[float], errors: int, rejected: int, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rejected": rejected,
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Lists scenarios whose p95 latency rose, or throughput fell, by more than
+    `tolerance` (a fraction) relative to the baseline."""
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            continue
+        if previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms"
+            )
+        if previous["rps"] and current["rps"] < previous["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: {previous['rps']} -> {current['rps']} req/s")
+        if current["errors"] > previous["errors"]:
+            regressions.append(
+                f"{name}: errors {previous['errors']} -> {current['errors']}"
+            )
+    return regressions
+
+
+async def seed(users: int, todos: int):
+    """Creates the schema and `users` users with `todos` todos each. Returns
+    (username, todo ids) per user."""
+    from sqlalchemy import insert, select
+    from db import SessionLocal, engine
+    from migrations import run_migrations
+    from models import Todos, Users
+    from passwords import hash_password
+
+    await run_migrations(engine)
+
+    hashed_password = await hash_password(PASSWORD)
+    seeded = []
+    async with SessionLocal() as db:
+        for number in range(users):
+            username = f"bench{number}"
+            user = Users(
+                email=f"{username}@example.com",
+                username=username,
+                first_name="Bench",
+                last_name=str(number),
+                hashed_password=hashed_password,
+                role="user",
+                is_active=True,
+            )
+            db.add(user)
+            await db.flush()
+            rows = [
+                {
+                    "title": f"Benchmark todo {index}",
+                    "description": f"Seeded row {index} for {username}",
+                    "priority": index % 5 + 1,
+                    "complete": index % 3 == 0,
+                    "owner_id": user.id,
+                }
+                for index in range(todos)
+            ]
+            for start in range(0, len(rows), 5000):
+                await db.execute(insert(Todos), rows[start : start + 5000])
+            ids = list(
+                await db.scalars(select(Todos.id).where(Todos.owner_id == user.id))
+            )
+            seeded.append((username, ids))
+        await db.commit()
+    await engine.dispose()
+    return seeded
+
+
+def scenarios(seeded: list, tokens: list[str], static_path: str):
+    """Builds (name, request factory) pairs. Each factory returns the
+    arguments for one httpx request."""
+    todo = {"title": "Benchmark write", "description": "Written by the benchmark", "priority": 3, "complete": False}
+
+    def pick():
+        index = random.randrange(len(seeded))
+        return {"Authorization": f"Bearer {tokens[index]}"}, seeded[index][1]
+
+    def login():
+        username = random.choice(seeded)[0]
+        return "POST", "/auth/token", {"data": {"username": username, "password": PASSWORD}}
+
+    def list_todos(size):
+        def factory():
+            headers, _ = pick()
+            return "GET", "/Todos", {"headers": headers, "params": {"limit": size}}
+
+        return factory
+
+    def get_one():
+        headers, ids = pick()
+        return "GET", f"/Todos/{random.choice(ids)}", {"headers": headers}
+
+    def create():
+        headers, _ = pick()
+        return "POST", "/Todos", {"headers": headers, "json": todo}
+
+    def update():
+        headers, ids = pick()
+        return "PUT", f"/Todos/{random.choice(ids)}", {"headers": headers, "json": todo}
+
+    def delete():
+        # Deletes seeded rows from the end of each user's list; updates and
+        # reads pick from the whole list and tolerate the odd 404.
+        headers, ids = pick()
+        return "DELETE", f"/Todos/{ids.pop() if len(ids) > 1 else ids[0]}", {"headers": headers}
+
+    def static():
+        return "GET", static_path, {"headers": {"Accept-Encoding": "br, gzip"}}
+
+    return [
+        ("login", login),
+        *((f"list_{size}", list_todos(size)) for size in LIST_SIZES),
+        ("get", get_one),
+        ("create", create),
+        ("update", update),
+        ("delete", delete),
+        ("static", static),
+    ]
+
+
+async def run_scenario(client, factory, requests: int, concurrency: int) -> dict:
+    latencies: list[float] = []
+    errors = rejected = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors, rejected
+        while remaining > 0:
+            remaining -= 1
+            method, url, kwargs = factory()
+            started = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            await response.aread()
+            latencies.append(time.perf_counter() - started)
+            # 429/503 are the server shedding load on purpose, not failures.
+            if response.status_code in (429, 503):
+                rejected += 1
+            elif response.status_code >= 400 and response.status_code != 404:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarise(latencies, errors, rejected, time.perf_counter() - started)
+
+
+async def login_all(client, seeded) -> list[str]:
+    tokens = []
+    for username, _ in seeded:
+        response = await client.post(
+            "/auth/token", data={"username": username, "password": PASSWORD}
+        )
+        response.raise_for_status()
+        tokens.append(response.json()["access_token"])
+    return tokens
+
+
+async def run_all(client, seeded, args) -> dict:
+    from static_assets import assets
+
+    tokens = await login_all(client, seeded)
+    static_path = "/static/" + assets.hashed_path("todo/css/bootstrap.css")
+    results = {}
+    for name, factory in scenarios(seeded, tokens, static_path):
+        if args.only and name not in args.only:
+            continue
+        # Logins are deliberately expensive; run fewer so the suite stays quick.
+        requests = max(args.requests // 10, args.concurrency) if name == "login" else args.requests
+        for _ in range(args.warmup):
+            method, url, kwargs = factory()
+            await client.request(method, url, **kwargs)
+        results[name] = await run_scenario(client, factory, requests, args.concurrency)
+        print(f"{name:>10}: {json.dumps(results[name])}", flush=True)
+    return results
+
+
+async def run_in_process(seeded, args) -> dict:
+    import httpx
+    from main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            return await run_all(client, seeded, args)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run_against_server(seeded, args) -> dict:
+    import httpx
+
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        env=os.environ.copy(),
+    )
+    limits = httpx.Limits(max_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60
+        ) as client:
+            for _ in range(100):
+                try:
+                    if (await client.get("/healthy")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.1)
+            else:
+                raise RuntimeError("uvicorn did not start")
+            return await run_all(client, seeded, args)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=["asgi", "server"], default="asgi")
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--todos", type=int, default=1000, help="todos per user")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers (server mode)")
+    parser.add_argument("--only", nargs="*", help="run only these scenarios")
+    parser.add_argument("--database", help="SQLite file to use (default: a temp file)")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--baseline", help="compare against this results JSON")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    output = Path(args.output).resolve() if args.output else None
+    baseline_path = Path(args.baseline).resolve() if args.baseline else None
+    workdir = tempfile.mkdtemp(prefix="todos-bench-")
+    database = os.path.abspath(args.database or os.path.join(workdir, "bench.db"))
+    os.environ["DATABASE_URL"] = f"sqlite:///{database}"
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+    os.environ.setdefault("ALGORITHM", "HS256")
+    # Every scenario comes from one client IP and a handful of users; measure
+    # the endpoints rather than the rate limits unless asked to.
+    for name in ("AUTH_RATE_PER_SECOND", "USER_RATE_PER_SECOND"):
+        os.environ.setdefault(name, "0")
+    # The app resolves static/ and templates/ relative to the working directory.
+    os.chdir(Path(__file__).resolve().parent.parent)
+    sys.path.insert(0, os.getcwd())
+
+    random.seed(0)
+    seeded = asyncio.run(seed(args.users, args.todos))
+    runner = run_in_process if args.mode == "asgi" else run_against_server
+    results = {
+        "config": {
+            key: getattr(args, key)
+            for key in ("mode", "users", "todos", "requests", "concurrency", "workers")
+        },
+        "scenarios": asyncio.run(runner(seeded, args)),
+    }
+
+    if output:
+        output.write_text(json.dumps(results, indent=2) + "\n")
+    else:
+        print(json.dumps(results, indent=2))
+
+    if baseline_path:
+        baseline = json.loads(baseline_path.read_text())
+        if baseline.get("config") != results["config"]:
+            print("warning: baseline was recorded with a different config", file=sys.stderr)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""Per-user change tracking for todos.
+
+Every transaction that writes a user's todos takes the next value of that
+user's counter in `change_counters` and stamps it on the rows it writes, and
+on tombstones for the rows it deletes. The counter row stays locked until the
+transaction commits, so versions become visible in order: a client that has
+seen version N has seen every change up to N. That lets GET /Todos/changes
+serve only what is newer than a client's cursor, and lets list ETags come
+from one primary-key lookup instead of the list query.
+"""
+import asyncio
+import hashlib
+import heapq
+from typing import Optional
+from sqlalchemy import insert, literal, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from models import ChangeCounters, Todos, TodoTombstones
+from rendering import page_cache
+
+CHANGE_COLUMNS = (
+    Todos.id,
+    Todos.title,
+    Todos.description,
+    Todos.priority,
+    Todos.complete,
+    Todos.owner_id,
+    Todos.version,
+)
+
+
+async def next_version(db, owner_id: int) -> int:
+    """Bumps and returns the user's change counter inside the caller's transaction."""
+    dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+    statement = (
+        dialect.insert(ChangeCounters)
+        .values(owner_id=owner_id, version=1)
+        .on_conflict_do_update(
+            index_elements=[ChangeCounters.owner_id],
+            set_={"version": ChangeCounters.version + 1},
+        )
+        .returning(ChangeCounters.version)
+    )
+    return await db.scalar(statement)
+
+
+async def current_version(db, owner_id: int) -> int:
+    version = await db.scalar(
+        select(ChangeCounters.version).where(ChangeCounters.owner_id == owner_id)
+    )
+    return version or 0
+
+
+async def record_deletions(db, owner_id: int, version: int, ids):
+    rows = [{"owner_id": owner_id, "version": version, "todo_id": id} for id in ids]
+    if rows:
+        await db.execute(insert(TodoTombstones), rows)
+
+
+async def read_changes(db, owner_id: int, after: Optional[list], limit: int):
+    """Returns up to `limit` changes after the (version, id) position `after`,
+    oldest first, and whether more are waiting. Without a position every
+    current todo is returned and tombstones are skipped: a client starting
+    from scratch has nothing to delete.
+
+    The two queries below may each see a different snapshot, so both stop at
+    the counter value read first. Everything up to it has committed, and a
+    later write can only move a row past it, where the next poll finds it.
+    Without the bound a write landing between the queries could be returned
+    by one and skipped by the other, and the cursor would move past it."""
+    upto = await current_version(db, owner_id)
+    todos = select(*CHANGE_COLUMNS).where(Todos.owner_id == owner_id, Todos.version <= upto)
+    if after is not None:
+        bound = tuple_(*(literal(value) for value in after))
+        todos = todos.where(tuple_(Todos.version, Todos.id) > bound)
+    rows = await db.execute(todos.order_by(Todos.version, Todos.id).limit(limit + 1))
+    changes = [
+        {"id": row.id, "version": row.version, "deleted": False, "todo": row._asdict()}
+        for row in rows
+    ]
+
+    if after is not None:
+        tombstones = await db.execute(
+            select(TodoTombstones.todo_id, TodoTombstones.version)
+            .where(
+                TodoTombstones.owner_id == owner_id,
+                TodoTombstones.version <= upto,
+                tuple_(TodoTombstones.version, TodoTombstones.todo_id) > bound,
+            )
+            .order_by(TodoTombstones.version, TodoTombstones.todo_id)
+            .limit(limit + 1)
+        )
+        deletions = [
+            {"id": todo_id, "version": version, "deleted": True, "todo": None}
+            for todo_id, version in tombstones
+        ]
+        changes = list(
+            heapq.merge(changes, deletions, key=lambda change: (change["version"], change["id"]))
+        )
+
+    return changes[:limit], len(changes) > limit
+
+
+def list_etag(owner_id: int, version: int, query: str) -> str:
+    """A list response is fully determined by its owner, their change counter
+    and the query string, so the ETag is known before running the query."""
+    digest = hashlib.sha256(f"{owner_id}:{version}:{query}".encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def todo_etag(id: int, version: int) -> str:
+    return f'"todo-{id}-{version}"'
+
+
+class ChangeNotifier:
+    """Wakes this process's change streams when a user's writes commit.
+    Streams also re-poll on a timer, which covers writes made by other workers."""
+
+    def __init__(self):
+        self.events: dict[int, asyncio.Event] = {}
+
+    def subscribe(self, owner_id: int) -> asyncio.Event:
+        """Call before reading changes, then wait on the event, so a commit in
+        between is not missed."""
+        return self.events.setdefault(owner_id, asyncio.Event())
+
+    def notify(self, owner_id: int):
+        event = self.events.pop(owner_id, None)
+        if event is not None:
+            event.set()
+
+
+notifier = ChangeNotifier()
+
+
+def changes_committed(owner_id: int):
+    """Call after committing a write to the user's todos."""
+    page_cache.invalidate(owner_id)
+    notifier.notify(owner_id)
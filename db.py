@@ -1,13 +1,63 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.ext.declarative import declarative_base
+import time
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base
+from metrics import instrument_engine, pool_checkout
+from settings import get_settings
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./todosapp.db"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+def async_database_url(url: str) -> str:
+    """Maps plain sqlite/postgres URLs onto their async drivers."""
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    for prefix in ("postgres://", "postgresql://"):
+        if url.startswith(prefix):
+            return url.replace(prefix, "postgresql+asyncpg://", 1)
+    return url
+
+
+settings = get_settings()
+
+SQLALCHEMY_DATABASE_URL = async_database_url(settings.database_url)
+
+pool_pre_ping = settings.db_pool_pre_ping
+if pool_pre_ping is None:
+    pool_pre_ping = not SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+
+engine = create_async_engine(
+    SQLALCHEMY_DATABASE_URL,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_recycle=settings.db_pool_recycle,
+    pool_timeout=settings.db_pool_timeout,
+    pool_pre_ping=pool_pre_ping,
 )
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers run alongside the single writer, and NORMAL only fsyncs
+    # at checkpoints, which is safe in WAL mode.
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+if engine.dialect.name == "sqlite":
+    event.listen(engine.sync_engine, "connect", set_sqlite_pragmas)
+instrument_engine(engine)
+
+SessionLocal = async_sessionmaker(
+    bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
 
 Base = declarative_base()
+
+
+async def get_db():
+    async with SessionLocal() as db:
+        # Check out the connection up front so the pool wait can be measured.
+        started = time.perf_counter()
+        await db.connection()
+        pool_checkout.observe(time.perf_counter() - started)
+        yield db
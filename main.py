@@ -1,14 +1,46 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-import models
+import metrics
 from db import engine
-from routers import auth, todos
-from starlette.staticfiles import StaticFiles
+from migrations import run_migrations
+from rate_limit import ConcurrencyLimitMiddleware
+from rendering import page_cache, warm_templates
+from routers import auth, pages, todos
+from starlette.concurrency import run_in_threadpool
+from static_assets import StaticAssets, assets
+from settings import get_settings
+from token_cache import token_cache
 
-app = FastAPI()
 
-models.Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if get_settings().auto_migrate:
+        await run_migrations(engine)
+    await run_in_threadpool(assets.build)
+    await run_in_threadpool(warm_templates)
+    yield
+    await engine.dispose()
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+
+app = FastAPI(lifespan=lifespan)
+# Outermost last: requests shed by the concurrency cap still show up in metrics.
+app.add_middleware(ConcurrencyLimitMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+
+metrics.register(
+    metrics.Gauge(
+        "cache_stats",
+        "Entries, hits and misses of the in-process caches.",
+        ("cache", "stat"),
+        lambda: {
+            (cache, stat): value
+            for cache, stats in (("token", token_cache.stats()), ("page", page_cache.stats()))
+            for stat, value in stats.items()
+        },
+    )
+)
+
+app.mount("/static", StaticAssets(assets), name="static")
 
 
 @app.get("/healthy")
@@ -16,7 +48,11 @@ def health_check():
     return {"status": "Healthy"}
 
 
+app.add_api_route("/metrics", metrics.metrics_endpoint, include_in_schema=False)
+
+
 app.include_router(auth.router)
 app.include_router(todos.router)
+app.include_router(pages.router)
 # app.include_router(admin.router)
 # app.include_router(users.router)
@@ -0,0 +1,239 @@
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import event
+from settings import get_settings
+
+# Requests slower than this many seconds are logged with their SQL. Unset = off.
+SLOW_REQUEST_SECONDS = get_settings().slow_request_seconds
+MAX_LOGGED_STATEMENTS = 50
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+logger = logging.getLogger("todos.slow_requests")
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{format_labels(self.labels, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, labels, buckets
+        # labels -> [per-bucket counts (non-cumulative, last is +Inf), sum, count]
+        self.values: dict[tuple, list] = {}
+        # Password hashing observes from worker threads.
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        with self.lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                le = format_labels(self.labels, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            suffix = format_labels(self.labels, labels)
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+class Gauge:
+    """Read when scraped from a callback returning {label values: value}."""
+
+    def __init__(self, name: str, help: str, labels: tuple, collect: Callable[[], dict]):
+        self.name, self.help, self.labels, self.collect = name, help, labels, collect
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for labels, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{format_labels(self.labels, labels)} {value}")
+        return lines
+
+
+registry: list = []
+
+
+def register(metric):
+    registry.append(metric)
+    return metric
+
+
+http_requests = register(
+    Counter("http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"))
+)
+http_latency = register(
+    Histogram("http_request_duration_seconds", "HTTP request latency.", ("method", "route"))
+)
+request_sql_queries = register(
+    Histogram("http_request_sql_queries", "SQL statements issued per request.", ("route",), COUNT_BUCKETS)
+)
+request_sql_seconds = register(
+    Histogram("http_request_sql_seconds", "Time spent in SQL per request.", ("route",))
+)
+sql_statements = register(Counter("db_statements_total", "SQL statements executed."))
+sql_latency = register(Histogram("db_statement_duration_seconds", "SQL statement latency."))
+pool_checkout = register(
+    Histogram("db_pool_checkout_seconds", "Wait for a pooled database connection.")
+)
+auth_spans = register(
+    Histogram("auth_duration_seconds", "Time spent hashing passwords and handling JWTs.", ("operation",))
+)
+
+
+class RequestStats:
+    __slots__ = ("queries", "sql_seconds", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.statements: list[tuple[float, str]] = []
+
+
+request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+@contextmanager
+def span(operation: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        auth_spans.observe(time.perf_counter() - started, operation)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # A connection runs one statement at a time, so one slot is enough. A
+    # statement that fails never reaches after_cursor_execute and its start
+    # time is simply overwritten by the next one.
+    conn.info["query_started"] = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("query_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    sql_statements.inc()
+    sql_latency.observe(elapsed)
+    stats = request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.sql_seconds += elapsed
+        if SLOW_REQUEST_SECONDS is not None and len(stats.statements) < MAX_LOGGED_STATEMENTS:
+            stats.statements.append((elapsed, statement))
+
+
+def instrument_engine(engine):
+    """Hooks statement timing into an (async) engine."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", after_cursor_execute)
+
+
+def route_template(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """Records latency, status and SQL usage for every HTTP request, labelled by
+    route template (`/Todos/{id}`) so cardinality stays bounded."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            request_stats.reset(token)
+            route = route_template(scope)
+            http_requests.inc(scope["method"], route, status_code)
+            http_latency.observe(elapsed, scope["method"], route)
+            request_sql_queries.observe(stats.queries, route)
+            request_sql_seconds.observe(stats.sql_seconds, route)
+            if SLOW_REQUEST_SECONDS is not None and elapsed >= SLOW_REQUEST_SECONDS:
+                log_slow_request(scope, status_code, elapsed, stats)
+
+
+def log_slow_request(scope, status_code: int, elapsed: float, stats: RequestStats):
+    statements = "\n".join(
+        f"  [{duration * 1000:.1f}ms] {' '.join(statement.split())}"
+        for duration, statement in stats.statements
+    )
+    logger.warning(
+        "Slow request %s %s -> %s in %.1fms, %d queries (%.1fms SQL)\n%s",
+        scope["method"],
+        scope["path"],
+        status_code,
+        elapsed * 1000,
+        stats.queries,
+        stats.sql_seconds * 1000,
+        statements,
+    )
+
+
+def render() -> str:
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+async def metrics_endpoint():
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
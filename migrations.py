@@ -0,0 +1,257 @@
+"""Versioned schema migrations.
+
+The applied version is stored in `schema_version`. migrate() takes a database
+wide lock first, so when several workers start at once one of them applies
+the pending steps and the others wait and then find nothing to do. Once the
+schema is current, startup costs a single SELECT instead of reflecting every
+table.
+
+    python migrations.py    # apply pending migrations, e.g. as a deploy step
+"""
+import asyncio
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, MetaData, String, Table, inspect, text
+
+# Arbitrary constant identifying this app's migration lock on Postgres.
+MIGRATION_LOCK_KEY = 7_310_042
+# How long SQLite workers wait for another worker's migrations, in ms. The
+# driver's default of 5 s is shorter than rebuilding a large search index.
+MIGRATION_BUSY_TIMEOUT_MS = 30 * 60 * 1000
+
+
+# Steps build fixed snapshots of the schema rather than the current models, so
+# what a released step does never changes when the models do.
+V1_SCHEMA = MetaData()
+Table(
+    "users",
+    V1_SCHEMA,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("email", String, unique=True),
+    Column("username", String, unique=True),
+    Column("first_name", String),
+    Column("last_name", String),
+    Column("hashed_password", String),
+    Column("is_active", Boolean),
+    Column("role", String),
+)
+Table(
+    "todos",
+    V1_SCHEMA,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("title", String),
+    Column("description", String),
+    Column("priority", Integer),
+    Column("complete", Boolean),
+    Column("user_id", Integer, ForeignKey("users.id")),
+)
+
+V4_SCHEMA = MetaData()
+Table(
+    "change_counters",
+    V4_SCHEMA,
+    Column("owner_id", Integer, primary_key=True, autoincrement=False),
+    Column("version", Integer, nullable=False),
+)
+Table(
+    "todo_tombstones",
+    V4_SCHEMA,
+    Column("owner_id", Integer, primary_key=True, autoincrement=False),
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("todo_id", Integer, primary_key=True, autoincrement=False),
+)
+
+
+def create_tables(connection):
+    V1_SCHEMA.create_all(bind=connection)
+
+
+def create_todo_indexes(connection):
+    # create_all skipped tables that already existed, so databases created
+    # before the listing indexes were added need them created separately.
+    for statement in (
+        "CREATE INDEX IF NOT EXISTS ix_todos_owner_id ON todos (user_id, id)",
+        "CREATE INDEX IF NOT EXISTS ix_todos_owner_priority_id ON todos (user_id, priority, id)",
+        "CREATE INDEX IF NOT EXISTS ix_todos_owner_complete_id ON todos (user_id, complete, id)",
+        "CREATE INDEX IF NOT EXISTS ix_todos_owner_complete_priority_id "
+        "ON todos (user_id, complete, priority, id)",
+    ):
+        connection.execute(text(statement))
+
+
+# The search index as step 3 released it; search.py holds the current layout.
+V3_SEARCH = {
+    "sqlite": [
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS todos_fts USING fts5(
+            title, description, content='todos', content_rowid='id',
+            tokenize='porter unicode61'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS todos_fts_insert AFTER INSERT ON todos BEGIN
+            INSERT INTO todos_fts(rowid, title, description)
+            VALUES (new.id, new.title, new.description);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS todos_fts_delete AFTER DELETE ON todos BEGIN
+            INSERT INTO todos_fts(todos_fts, rowid, title, description)
+            VALUES ('delete', old.id, old.title, old.description);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS todos_fts_update AFTER UPDATE OF title, description ON todos BEGIN
+            INSERT INTO todos_fts(todos_fts, rowid, title, description)
+            VALUES ('delete', old.id, old.title, old.description);
+            INSERT INTO todos_fts(rowid, title, description)
+            VALUES (new.id, new.title, new.description);
+        END
+        """,
+        # Index the rows that were written before the index existed.
+        "INSERT INTO todos_fts(todos_fts) VALUES ('rebuild')",
+    ],
+    "postgresql": [
+        "CREATE INDEX IF NOT EXISTS ix_todos_search ON todos USING GIN (("
+        "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(description, '')), 'B')))",
+    ],
+}
+
+
+def create_search(connection):
+    for statement in V3_SEARCH.get(connection.dialect.name, []):
+        connection.execute(text(statement))
+
+
+def create_change_tracking(connection):
+    # Databases whose first migration ran against newer models may have it already.
+    columns = {column["name"] for column in inspect(connection).get_columns("todos")}
+    if "version" not in columns:
+        connection.execute(
+            text("ALTER TABLE todos ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        )
+    V4_SCHEMA.create_all(bind=connection)
+    connection.execute(
+        text("CREATE INDEX IF NOT EXISTS ix_todos_owner_version_id ON todos (user_id, version, id)")
+    )
+
+
+# Step 5 rebuilds SQLite's search index with the owner column, so a search
+# only walks the user's own entries. Postgres filters by owner on the table.
+V5_SEARCH = {
+    "sqlite": [
+        "DROP TRIGGER IF EXISTS todos_fts_insert",
+        "DROP TRIGGER IF EXISTS todos_fts_delete",
+        "DROP TRIGGER IF EXISTS todos_fts_update",
+        "DROP TABLE IF EXISTS todos_fts",
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS todos_fts USING fts5(
+            title, description, user_id, content='todos', content_rowid='id',
+            tokenize='porter unicode61'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS todos_fts_insert AFTER INSERT ON todos BEGIN
+            INSERT INTO todos_fts(rowid, title, description, user_id)
+            VALUES (new.id, new.title, new.description, new.user_id);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS todos_fts_delete AFTER DELETE ON todos BEGIN
+            INSERT INTO todos_fts(todos_fts, rowid, title, description, user_id)
+            VALUES ('delete', old.id, old.title, old.description, old.user_id);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS todos_fts_update
+        AFTER UPDATE OF title, description, user_id ON todos BEGIN
+            INSERT INTO todos_fts(todos_fts, rowid, title, description, user_id)
+            VALUES ('delete', old.id, old.title, old.description, old.user_id);
+            INSERT INTO todos_fts(rowid, title, description, user_id)
+            VALUES (new.id, new.title, new.description, new.user_id);
+        END
+        """,
+        "INSERT INTO todos_fts(todos_fts) VALUES ('rebuild')",
+    ],
+}
+
+
+def scope_search_to_owner(connection):
+    for statement in V5_SEARCH.get(connection.dialect.name, []):
+        connection.execute(text(statement))
+
+
+# (version, description, step). Steps run in order and must not be edited once
+# released; append a new one instead.
+MIGRATIONS = [
+    (1, "create tables", create_tables),
+    (2, "keyset listing indexes on todos", create_todo_indexes),
+    (3, "full-text search index", create_search),
+    (4, "todo versions, change counters and tombstones", create_change_tracking),
+    (5, "owner-scoped SQLite search index", scope_search_to_owner),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def lock(connection):
+    if connection.dialect.name == "postgresql":
+        connection.execute(
+            text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY}
+        )
+    elif connection.dialect.name == "sqlite":
+        # Take SQLite's write lock up front; other workers block here (up to
+        # the busy timeout) until this transaction commits.
+        connection.exec_driver_sql(f"PRAGMA busy_timeout = {MIGRATION_BUSY_TIMEOUT_MS}")
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def current_version(connection) -> int:
+    connection.execute(
+        text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+    )
+    version = connection.execute(text("SELECT max(version) FROM schema_version")).scalar()
+    return version or 0
+
+
+def migrate(connection) -> list[int]:
+    """Applies pending migrations inside the caller's transaction (sync, for
+    run_sync) and returns the versions applied."""
+    busy_timeout = None
+    if connection.dialect.name == "sqlite":
+        # The connection returns to the app's pool afterwards; put it back.
+        busy_timeout = connection.exec_driver_sql("PRAGMA busy_timeout").scalar()
+    try:
+        lock(connection)
+        version = current_version(connection)
+        applied = []
+        for number, description, step in MIGRATIONS:
+            if number > version:
+                step(connection)
+                applied.append(number)
+        if applied:
+            connection.execute(text("DELETE FROM schema_version"))
+            connection.execute(
+                text("INSERT INTO schema_version (version) VALUES (:version)"),
+                {"version": applied[-1]},
+            )
+        return applied
+    finally:
+        if busy_timeout is not None:
+            connection.exec_driver_sql(f"PRAGMA busy_timeout = {busy_timeout}")
+
+
+async def run_migrations(engine) -> list[int]:
+    async with engine.begin() as connection:
+        return await connection.run_sync(migrate)
+
+
+async def main():
+    from db import engine
+
+    applied = await run_migrations(engine)
+    await engine.dispose()
+    print(f"Applied migrations {applied}." if applied else "Schema is up to date.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,5 +1,5 @@
 from db import Base
-from sqlalchemy import Column, ForeignKey, Integer, String, Boolean
+from sqlalchemy import Column, ForeignKey, Index, Integer, String, Boolean
 
 
 class Users(Base):
@@ -23,4 +23,37 @@ class Todos(Base):
     description = Column(String)
     priority = Column(Integer)
     complete = Column(Boolean, default=False)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    # The column keeps its original name so existing databases still line up.
+    owner_id = Column("user_id", Integer, ForeignKey("users.id"))
+    # The owner's change counter value as of this row's last write; see changes.py.
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+
+    # Composite indexes backing the keyset-paginated listing in routers/todos.py.
+    # Each one ends in the sort key(s) so a page is a single index range scan.
+    __table_args__ = (
+        Index("ix_todos_owner_id", "user_id", "id"),
+        Index("ix_todos_owner_priority_id", "user_id", "priority", "id"),
+        Index("ix_todos_owner_complete_id", "user_id", "complete", "id"),
+        Index("ix_todos_owner_complete_priority_id", "user_id", "complete", "priority", "id"),
+        # Backs the /Todos/changes feed.
+        Index("ix_todos_owner_version_id", "user_id", "version", "id"),
+    )
+
+
+class ChangeCounters(Base):
+    """One row per user, bumped by every transaction that changes their todos."""
+
+    __tablename__ = "change_counters"
+
+    owner_id = Column(Integer, primary_key=True, autoincrement=False)
+    version = Column(Integer, nullable=False)
+
+
+class TodoTombstones(Base):
+    """Deleted todos, so the change feed can report deletions."""
+
+    __tablename__ = "todo_tombstones"
+
+    owner_id = Column(Integer, primary_key=True, autoincrement=False)
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    todo_id = Column(Integer, primary_key=True, autoincrement=False)
@@ -0,0 +1,67 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from fastapi import HTTPException, status
+from metrics import span
+from settings import get_settings
+
+settings = get_settings()
+# bcrypt costs ~250ms of CPU per call at the default 12 rounds. It releases the
+# GIL while hashing, so a small thread pool keeps that work off the event loop.
+BCRYPT_ROUNDS = settings.bcrypt_rounds
+HASH_WORKERS = settings.password_hash_workers
+# Calls beyond this many queued or running are rejected instead of waiting.
+HASH_MAX_PENDING = settings.password_hash_max_pending
+
+
+@lru_cache
+def get_bcrypt_context():
+    """Built on first use so importing the app doesn't load passlib and bcrypt."""
+    from passlib.context import CryptContext
+
+    # min_rounds makes verify_and_update flag hashes made with a lower cost, so
+    # raising BCRYPT_ROUNDS upgrades stored hashes as users log in.
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__rounds=BCRYPT_ROUNDS,
+        bcrypt__min_rounds=BCRYPT_ROUNDS,
+    )
+
+
+executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+pending = 0
+
+
+def timed(operation, func, *args):
+    with span(operation):
+        return func(*args)
+
+
+async def run_in_pool(operation, func, *args):
+    global pending
+    if pending >= HASH_MAX_PENDING:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many login attempts in progress, try again shortly.",
+            headers={"Retry-After": "1"},
+        )
+    pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(
+            executor, timed, operation, func, *args
+        )
+    finally:
+        pending -= 1
+
+
+async def hash_password(password: str) -> str:
+    return await run_in_pool("bcrypt_hash", get_bcrypt_context().hash, password)
+
+
+async def verify_password(password: str, hashed_password: str):
+    """Returns (valid, new_hash). new_hash is set when the stored hash uses
+    outdated settings (e.g. fewer rounds) and should replace it."""
+    return await run_in_pool(
+        "bcrypt_verify", get_bcrypt_context().verify_and_update, password, hashed_password
+    )
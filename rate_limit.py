@@ -0,0 +1,125 @@
+import math
+import time
+from collections import OrderedDict
+from typing import Protocol
+from fastapi import HTTPException, Request, status
+from fastapi.responses import JSONResponse
+from metrics import Counter, register
+from settings import get_settings
+
+settings = get_settings()
+
+rejections = register(
+    Counter("rate_limit_rejections_total", "Requests turned away by rate limits or the concurrency cap.", ("limit",))
+)
+
+
+class RateLimitBackend(Protocol):
+    """Storage for token buckets. The in-memory backend limits each worker on
+    its own; a shared store (e.g. Redis running the same arithmetic in a
+    script) can be plugged in with set_backend() to limit across workers."""
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        """Takes one token from `key`'s bucket. Returns 0 if there was one,
+        otherwise the seconds until there will be."""
+        ...
+
+
+class MemoryBackend:
+    def __init__(self, max_keys: int = settings.rate_limit_max_keys):
+        self.max_keys = max_keys
+        # key -> (tokens, last update), least recently used first.
+        self.buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        now = time.monotonic()
+        tokens, updated = self.buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        retry_after = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry_after = (1 - tokens) / rate
+        self.buckets[key] = (tokens, now)
+        # An evicted key starts again with a full bucket, which only errs towards allowing.
+        while len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+        return retry_after
+
+
+backend: RateLimitBackend = MemoryBackend()
+
+
+def set_backend(new_backend: RateLimitBackend):
+    global backend
+    backend = new_backend
+
+
+class RateLimit:
+    """A token bucket per key: `rate` requests per second on average with
+    bursts of up to `burst`. A rate of 0 disables the limit."""
+
+    def __init__(self, name: str, rate: float, burst: float):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+
+    async def check(self, key):
+        if self.rate <= 0:
+            return
+        retry_after = await backend.take(f"{self.name}:{key}", self.rate, self.burst)
+        if retry_after:
+            rejections.inc(self.name)
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests.",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+
+
+auth_rate_limit = RateLimit("auth", settings.auth_rate_per_second, settings.auth_burst)
+user_rate_limit = RateLimit("user", settings.user_rate_per_second, settings.user_burst)
+
+
+async def limit_by_ip(request: Request):
+    """Dependency for unauthenticated routes (login, sign-up), keyed by client IP."""
+    await auth_rate_limit.check(request.client.host if request.client else "unknown")
+
+
+class ConcurrencyLimitMiddleware:
+    """Answers 503 straight away once `max_concurrent` requests are in flight,
+    instead of letting them queue until they time out. Health checks and
+    metrics are exempt so an overloaded worker still looks alive, and change
+    streams because they stay open for as long as the client listens."""
+
+    exempt_paths = ("/healthy", "/metrics", "/Todos/changes/stream")
+
+    def __init__(self, app, max_concurrent: int = settings.max_concurrent_requests):
+        self.app = app
+        self.max_concurrent = max_concurrent
+        self.in_flight = 0
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or self.max_concurrent <= 0
+            or scope["path"] in self.exempt_paths
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        if self.in_flight >= self.max_concurrent:
+            rejections.inc("concurrency")
+            response = JSONResponse(
+                {"detail": "Server is busy, try again shortly."},
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": "1"},
+            )
+            await response(scope, receive, send)
+            return
+
+        self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
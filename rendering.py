@@ -0,0 +1,91 @@
+import hashlib
+import os
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+from settings import get_settings
+from static_assets import static_url
+
+TEMPLATE_DIRECTORY = "templates"
+# Compiled template bytecode is kept on disk so new workers skip parsing and compiling.
+TEMPLATE_CACHE_DIRECTORY = get_settings().template_cache_dir
+PAGE_CACHE_USERS = get_settings().page_cache_users
+PAGE_CACHE_PAGES_PER_USER = get_settings().page_cache_pages_per_user
+
+templates = Jinja2Templates(
+    env=Environment(
+        loader=FileSystemLoader(TEMPLATE_DIRECTORY),
+        bytecode_cache=FileSystemBytecodeCache(TEMPLATE_CACHE_DIRECTORY),
+        autoescape=select_autoescape(),
+    )
+)
+templates.env.globals["static_url"] = static_url
+
+
+def warm_templates():
+    """Compiles every template so the bytecode cache is populated before traffic."""
+    os.makedirs(TEMPLATE_CACHE_DIRECTORY, exist_ok=True)
+    for name in templates.env.list_templates():
+        templates.env.get_template(name)
+
+
+class CachedPage(NamedTuple):
+    html: str
+    etag: str
+    version: int
+
+
+class PageCache:
+    """Rendered HTML per user, keyed by page.
+
+    Each page remembers the user's change counter (see changes.py) it was
+    rendered at and is only served while the counter is unchanged, so a write
+    handled by any worker retires it. Holds up to `maxusers` users and
+    `maxpages` pages per user, least recently used first out. invalidate()
+    drops a user's pages straight away in the worker that made the write.
+    """
+
+    def __init__(self, maxusers: int = PAGE_CACHE_USERS, maxpages: int = PAGE_CACHE_PAGES_PER_USER):
+        self.maxusers = maxusers
+        self.maxpages = maxpages
+        self.users: OrderedDict[int, OrderedDict[str, CachedPage]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int, key: str, version: int) -> Optional[CachedPage]:
+        pages = self.users.get(user_id)
+        page = pages.get(key) if pages is not None else None
+        if page is None or page.version != version:
+            self.misses += 1
+            return None
+        pages.move_to_end(key)
+        self.users.move_to_end(user_id)
+        self.hits += 1
+        return page
+
+    def put(self, user_id: int, key: str, version: int, html: str) -> CachedPage:
+        page = CachedPage(html, f'"{hashlib.sha256(html.encode()).hexdigest()[:32]}"', version)
+        pages = self.users.setdefault(user_id, OrderedDict())
+        pages[key] = page
+        pages.move_to_end(key)
+        while len(pages) > self.maxpages:
+            pages.popitem(last=False)
+        self.users.move_to_end(user_id)
+        while len(self.users) > self.maxusers:
+            self.users.popitem(last=False)
+        return page
+
+    def invalidate(self, user_id: int):
+        self.users.pop(user_id, None)
+
+    def clear(self):
+        self.users.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        return {"users": len(self.users), "hits": self.hits, "misses": self.misses}
+
+
+page_cache = PageCache()
@@ -2,25 +2,24 @@ from datetime import datetime, timedelta, timezone
 from typing import Annotated
 from fastapi import Depends, APIRouter, HTTPException, status
 from pydantic import BaseModel, Field
-from db import SessionLocal
-from sqlalchemy.orm import Session
+from db import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from models import Users
-from passlib.context import CryptContext
+from passwords import hash_password, verify_password
+from rate_limit import limit_by_ip
+from metrics import span
+from token_cache import is_revoked, token_cache, token_digest
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
-from jose import jwt, JWTError
-import os
-from dotenv import load_dotenv
+from settings import get_settings
 
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
-bcrypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_bearer = OAuth2PasswordBearer(tokenUrl="token")
 
-load_dotenv()
-
-SECRET_KEY = os.environ.get("SECRET_KEY")
-ALGORITHM = os.environ.get("ALGORITHM")
+SECRET_KEY = get_settings().secret_key
+ALGORITHM = get_settings().algorithm
 
 
 class UserRequest(BaseModel):
@@ -37,36 +36,47 @@ class Token(BaseModel):
     token_type: str
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
+db_dependency = Annotated[AsyncSession, Depends(get_db)]
 
-db_dependency = Annotated[Session, Depends(get_db)]
 
-
-def authenticate_user(username: str, password: str, db):
-    user = db.query(Users).filter(Users.username == username).first()
+async def authenticate_user(username: str, password: str, db: AsyncSession):
+    user = await db.scalar(select(Users).filter(Users.username == username))
     if not user:
         return False
-    if not bcrypt_context.verify(password, user.hashed_password):
+    valid, new_hash = await verify_password(password, user.hashed_password)
+    if not valid:
         return False
+    if new_hash is not None:
+        user.hashed_password = new_hash
+        await db.commit()
     return user
 
 
 def create_access_token(username: str, user_id: int, expires_delta: timedelta):
+    # jose is imported on first use to keep app startup light.
+    from jose import jwt
+
     encode = {"sub": username, "id": user_id}
     expires = datetime.now(timezone.utc) + expires_delta
     encode.update({"exp": expires})
-    return jwt.encode(encode, SECRET_KEY, algorithm=ALGORITHM)
+    with span("jwt_encode"):
+        return jwt.encode(encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
 async def get_current_user(token: Annotated[str, Depends(oauth2_bearer)]):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    digest = token_digest(token)
+    claims = token_cache.get(digest)
+    if claims is None:
+        from jose import JWTError, jwt
+
+        try:
+            with span("jwt_decode"):
+                payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate user.",
+            )
         username: str = payload.get("sub")
         user_id: int = payload.get("id")
         if username is None or user_id is None:
@@ -74,14 +84,18 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_bearer)]):
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Could not validate user.",
             )
-        return {"username": username, "id": user_id}
-    except JWTError:
+        claims = {"username": username, "id": user_id}
+        if "exp" in payload:
+            token_cache.put(digest, claims, payload["exp"])
+    if is_revoked(digest, claims):
+        token_cache.discard(digest)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate user."
         )
+    return claims
 
 
-@router.post("/", status_code=status.HTTP_201_CREATED)
+@router.post("/", status_code=status.HTTP_201_CREATED, dependencies=[Depends(limit_by_ip)])
 async def create_user(db: db_dependency, user_request: UserRequest):
     user_model = Users(
         email=user_request.email,
@@ -89,19 +103,19 @@ async def create_user(db: db_dependency, user_request: UserRequest):
         first_name=user_request.first_name,
         last_name=user_request.last_name,
         role=user_request.role,
-        hashed_password=bcrypt_context.hash(user_request.password),
+        hashed_password=await hash_password(user_request.password),
         is_active=True,
     )
 
     db.add(user_model)
-    db.commit()
+    await db.commit()
 
 
-@router.post("/token", response_model=Token)
+@router.post("/token", response_model=Token, dependencies=[Depends(limit_by_ip)])
 async def login_for_access_token(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: db_dependency
 ):
-    user = authenticate_user(form_data.username, form_data.password, db)
+    user = await authenticate_user(form_data.username, form_data.password, db)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate user."
@@ -0,0 +1,96 @@
+from typing import Annotated, Optional
+from fastapi import Depends, APIRouter, HTTPException, Path, Request, Response, status
+from fastapi.responses import HTMLResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from changes import current_version
+from db import get_db
+from etags import etag_matches
+from models import Todos
+from rate_limit import user_rate_limit
+from rendering import CachedPage, page_cache, templates
+from .auth import get_current_user
+from .todos import MAX_PAGE_SIZE, TODO_COLUMNS, decode_cursor, encode_cursor
+
+router = APIRouter(prefix="/pages", tags=["pages"])
+
+
+async def get_page_user(request: Request):
+    """Browsers can't attach a bearer header to a page load, so pages also
+    accept the token from an `access_token` cookie."""
+    token = request.cookies.get("access_token")
+    if token is None:
+        scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() == "bearer":
+            token = credentials
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated"
+        )
+    user = await get_current_user(token)
+    # Pages draw from the same per-user bucket as the API.
+    await user_rate_limit.check(user.get("id"))
+    return user
+
+
+db_dependency = Annotated[AsyncSession, Depends(get_db)]
+user_dependency = Annotated[dict, Depends(get_page_user)]
+
+
+def page_response(request: Request, page: CachedPage):
+    headers = {"ETag": page.etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("If-None-Match"), page.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return HTMLResponse(page.html, headers=headers)
+
+
+@router.get("/todos", response_class=HTMLResponse, name="todos_page")
+async def todos_page(
+    request: Request,
+    user: user_dependency,
+    db: db_dependency,
+    after: Optional[str] = None,
+):
+    """Lists the user's todos MAX_PAGE_SIZE at a time, with a link to the next
+    page (keyset paginated by id, like GET /Todos)."""
+    version = await current_version(db, user.get("id"))
+    key = f"todos:{after or ''}"
+    page = page_cache.get(user.get("id"), key, version)
+    if page is None:
+        query = select(*TODO_COLUMNS).filter(Todos.owner_id == user.get("id"))
+        if after is not None:
+            query = query.filter(Todos.id > decode_cursor("id", after)[0])
+        todos = (await db.execute(query.order_by(Todos.id).limit(MAX_PAGE_SIZE + 1))).all()
+        next_cursor = None
+        if len(todos) > MAX_PAGE_SIZE:
+            todos = todos[:MAX_PAGE_SIZE]
+            next_cursor = encode_cursor("id", [todos[-1].id])
+        html = templates.get_template("todos.html").render(
+            request=request, todos=todos, next_cursor=next_cursor, first_page=after is None
+        )
+        page = page_cache.put(user.get("id"), key, version, html)
+    return page_response(request, page)
+
+
+@router.get("/todos/{id}", response_class=HTMLResponse, name="todo_page")
+async def todo_page(
+    request: Request, user: user_dependency, db: db_dependency, id: int = Path(gt=0)
+):
+    key = f"todo:{id}"
+    version = await current_version(db, user.get("id"))
+    page = page_cache.get(user.get("id"), key, version)
+    if page is None:
+        todo = (
+            await db.execute(
+                select(*TODO_COLUMNS).filter(
+                    Todos.id == id, Todos.owner_id == user.get("id")
+                )
+            )
+        ).first()
+        if todo is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Todo not found."
+            )
+        html = templates.get_template("todo.html").render(request=request, todo=todo)
+        page = page_cache.put(user.get("id"), key, version, html)
+    return page_response(request, page)
@@ -2,15 +2,44 @@
 # sys.path.append('..')
 
 # import models
-from typing import Annotated
+import asyncio
+import base64
+import binascii
+import json
+from typing import Annotated, Optional
 from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session
-from fastapi import Depends, APIRouter, HTTPException, Path, status, Request
+from sqlalchemy import bindparam, delete, insert, literal, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import Body, Depends, APIRouter, Header, HTTPException, Path, Query, status, Request, Response
 from models import Todos
-from db import SessionLocal
+from db import get_db
 from .auth import get_current_user
-from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import HTMLResponse, StreamingResponse
+from rendering import templates
+from changes import (
+    changes_committed,
+    current_version,
+    list_etag,
+    next_version,
+    notifier,
+    read_changes,
+    record_deletions,
+    todo_etag,
+)
+from etags import etag_matches
+from rate_limit import user_rate_limit
+from search import search_todos
+from transfer import (
+    EXPORT_BATCH_SIZE,
+    IMPORT_BATCH_SIZE,
+    IMPORT_FIELDS,
+    MAX_IMPORT_ERRORS,
+    MEDIA_TYPES,
+    export_lines,
+    import_error,
+    import_lines,
+    import_records,
+)
 
 router = APIRouter(
     # prefix="/todos",
@@ -19,19 +48,18 @@ router = APIRouter(
 )
 
 # models.Base.metadata.create_all(bind=engine)
-templates = Jinja2Templates(directory="templates")
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+db_dependency = Annotated[AsyncSession, Depends(get_db)]
+
+
+async def get_rate_limited_user(user: Annotated[dict, Depends(get_current_user)]):
+    if user is not None:
+        await user_rate_limit.check(user.get("id"))
+    return user
 
 
-db_dependency = Annotated[Session, Depends(get_db)]
-user_dependency = Annotated[dict, Depends(get_current_user)]
+user_dependency = Annotated[dict, Depends(get_rate_limited_user)]
 
 
 class TodoRequest(BaseModel):
@@ -41,41 +69,323 @@ class TodoRequest(BaseModel):
     complete: bool
 
 
+class TodoBatchUpdate(TodoRequest):
+    id: int = Field(gt=0)
+
+
+class TodoResponse(BaseModel):
+    id: int
+    title: str
+    description: str
+    priority: int
+    complete: bool
+    owner_id: int
+
+
+class TodoSearchResult(TodoResponse):
+    title_snippet: str
+    description_snippet: str
+    rank: float
+
+
+class ImportResponse(BaseModel):
+    imported: int
+    errors: list[dict]
+
+
+class TodoPage(BaseModel):
+    items: list[TodoResponse]
+    next_cursor: Optional[str] = None
+
+
+class TodoChange(BaseModel):
+    id: int
+    version: int
+    deleted: bool
+    todo: Optional[TodoResponse] = None
+
+
+class ChangeFeed(BaseModel):
+    changes: list[TodoChange]
+    next_cursor: str
+    has_more: bool
+
+
+class BatchItemResult(BaseModel):
+    id: int
+    status: int
+
+
+class BatchResponse(BaseModel):
+    results: list[BatchItemResult]
+
+
+MAX_PAGE_SIZE = 200
+MAX_BATCH_SIZE = 500
+# Change streams re-poll (and send a keep-alive comment) this often when idle,
+# which also picks up writes committed by other workers.
+STREAM_HEARTBEAT_SECONDS = 15
+
+# Columns returned by the list endpoint; selecting them directly skips building ORM objects.
+TODO_COLUMNS = (
+    Todos.id,
+    Todos.title,
+    Todos.description,
+    Todos.priority,
+    Todos.complete,
+    Todos.owner_id,
+)
+
+# Sort keys accepted by read_all. Every key is followed by Todos.id so the
+# ordering is total and a keyset cursor always points at exactly one row.
+SORT_KEYS = {
+    "id": (Todos.id,),
+    "priority": (Todos.priority, Todos.id),
+}
+
+
+# Cursor values must fit a 64-bit integer column.
+MIN_KEY = -(2**63)
+MAX_KEY = 2**63 - 1
+
+
+def encode_cursor(sort: str, values: list) -> str:
+    raw = json.dumps({"s": sort, "k": values}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(sort: str, token: str, size: Optional[int] = None) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        cursor = json.loads(raw)
+        values = cursor["k"]
+        if size is None:
+            size = len(SORT_KEYS[sort.lstrip("-")])
+        # Every key column is an integer; anything else would reach the database.
+        valid = (
+            cursor["s"] == sort
+            and len(values) == size
+            and all(type(value) is int and MIN_KEY <= value <= MAX_KEY for value in values)
+        )
+    except (ValueError, binascii.Error, KeyError, TypeError):
+        valid = False
+    if not valid:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor."
+        )
+    return values
+
+
 @router.get("/test")
 async def test(request: Request):
-    return templates.TemplateResponse("home.html", {"request": request})
+    return templates.TemplateResponse(request, "home.html")
+
+
+@router.get("/Todos", status_code=status.HTTP_200_OK, response_model=TodoPage)
+async def read_all(
+    user: user_dependency,
+    db: db_dependency,
+    request: Request,
+    response: Response,
+    limit: int = Query(50, gt=0, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    complete: Optional[bool] = None,
+    priority: Optional[int] = Query(None, gt=0, lt=6),
+    sort: str = Query("id", pattern="^-?(id|priority)$"),
+):
+    """Returns one page of the user's todos. Pages are keyset paginated: pass the
+    `next_cursor` of a page as `after` to get the next one. The cursor is only
+    valid for the `sort` it was issued with. Responses carry an ETag; send it
+    back as If-None-Match to get a 304 while nothing has changed.
+    """
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication Failed"
+        )
+
+    version = await current_version(db, user.get("id"))
+    headers = {
+        "ETag": list_etag(user.get("id"), version, request.url.query),
+        "Cache-Control": "private, no-cache",
+    }
+    if etag_matches(request.headers.get("If-None-Match"), headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+
+    descending = sort.startswith("-")
+    keys = SORT_KEYS[sort.lstrip("-")]
+
+    query = select(*TODO_COLUMNS).filter(Todos.owner_id == user.get("id"))
+    if complete is not None:
+        query = query.filter(Todos.complete == complete)
+    if priority is not None:
+        query = query.filter(Todos.priority == priority)
+    if after is not None:
+        position = tuple_(*keys)
+        bound = tuple_(*(literal(value) for value in decode_cursor(sort, after)))
+        query = query.filter(position < bound if descending else position > bound)
+
+    order = [key.desc() if descending else key.asc() for key in keys]
+    # Fetch one extra row to learn whether another page exists.
+    rows = (await db.execute(query.order_by(*order).limit(limit + 1))).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(sort, [getattr(last, key.key) for key in keys])
+
+    return {"items": [row._asdict() for row in rows], "next_cursor": next_cursor}
+
+
+@router.get(
+    "/Todos/search",
+    status_code=status.HTTP_200_OK,
+    response_model=list[TodoSearchResult],
+)
+async def search(
+    user: user_dependency,
+    db: db_dependency,
+    q: str = Query(min_length=1, max_length=200),
+    limit: int = Query(20, gt=0, le=MAX_PAGE_SIZE),
+):
+    """Full-text search over the user's todo titles and descriptions, best
+    match first. Snippets are HTML-escaped with matches wrapped in <mark>."""
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication Failed"
+        )
+
+    return await search_todos(db, user.get("id"), q, limit)
+
+
+@router.get("/Todos/export", status_code=status.HTTP_200_OK)
+async def export_todos(
+    user: user_dependency,
+    db: db_dependency,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+):
+    """Streams all of the user's todos as NDJSON or CSV. Rows are read through a
+    server-side cursor in batches, so memory use does not grow with the export."""
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication Failed"
+        )
+
+    result = await db.stream(
+        select(*TODO_COLUMNS)
+        .filter(Todos.owner_id == user.get("id"))
+        .order_by(Todos.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    return StreamingResponse(
+        export_lines(result, format),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="todos.{format}"'},
+    )
+
+
+def change_feed(changes: list, has_more: bool, after: Optional[list]) -> dict:
+    position = [changes[-1]["version"], changes[-1]["id"]] if changes else after or [0, 0]
+    return {
+        "changes": changes,
+        "next_cursor": encode_cursor("changes", position),
+        "has_more": has_more,
+    }
+
+
+@router.get("/Todos/changes", status_code=status.HTTP_200_OK, response_model=ChangeFeed)
+async def read_changes_since(
+    user: user_dependency,
+    db: db_dependency,
+    since: Optional[str] = None,
+    limit: int = Query(100, gt=0, le=MAX_PAGE_SIZE),
+):
+    """Returns what changed in the user's todos after the `since` cursor,
+    oldest first: current rows for creations and updates, `deleted` entries
+    for deletions. Without `since` it returns every todo. Keep the returned
+    `next_cursor` and poll with it; while `has_more` is true, call again
+    straight away."""
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication Failed"
+        )
 
+    after = decode_cursor("changes", since, 2) if since else None
+    changes, has_more = await read_changes(db, user.get("id"), after, limit)
+    return change_feed(changes, has_more, after)
 
-@router.get("/Todos", status_code=status.HTTP_200_OK)
-async def read_all(user: user_dependency, db: db_dependency):
 
+@router.get("/Todos/changes/stream", status_code=status.HTTP_200_OK)
+async def stream_changes(
+    user: user_dependency,
+    db: db_dependency,
+    request: Request,
+    since: Optional[str] = None,
+    last_event_id: Optional[str] = Header(None),
+):
+    """Server-sent events carrying the same payload as /Todos/changes, pushed
+    as writes commit. Each event's id is its cursor, so a reconnecting
+    EventSource resumes where it left off via Last-Event-ID."""
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication Failed"
         )
 
-    return db.query(Todos).filter(Todos.owner_id == user.get("id")).all()
+    cursor = last_event_id or since
+    after = decode_cursor("changes", cursor, 2) if cursor else None
+    return StreamingResponse(
+        change_events(request, db, user.get("id"), after),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def change_events(request: Request, db: AsyncSession, owner_id: int, after: Optional[list]):
+    while not await request.is_disconnected():
+        wake = notifier.subscribe(owner_id)
+        changes, has_more = await read_changes(db, owner_id, after, MAX_PAGE_SIZE)
+        # Hand the connection back to the pool while the stream is idle.
+        await db.rollback()
+        if changes:
+            feed = ChangeFeed.model_validate(change_feed(changes, has_more, after))
+            after = [changes[-1]["version"], changes[-1]["id"]]
+            yield f"id: {feed.next_cursor}\nevent: changes\ndata: {feed.model_dump_json()}\n\n"
+        if has_more:
+            continue
+        try:
+            await asyncio.wait_for(wake.wait(), STREAM_HEARTBEAT_SECONDS)
+        except asyncio.TimeoutError:
+            yield ": keep-alive\n\n"
 
 
 @router.get("/Todos/{id}", status_code=status.HTTP_200_OK)
 async def get_single_todos(
-    user: user_dependency, db: db_dependency, id: int = Path(gt=0)
+    user: user_dependency,
+    db: db_dependency,
+    request: Request,
+    response: Response,
+    id: int = Path(gt=0),
 ):
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication Failed"
         )
 
-    todo_model = (
-        db.query(Todos)
-        .filter(Todos.id == id)
-        .filter(Todos.owner_id == user.get("id"))
-        .first()
+    todo_model = await db.scalar(
+        select(Todos).filter(Todos.id == id).filter(Todos.owner_id == user.get("id"))
     )
     if todo_model is not None:
+        headers = {
+            "ETag": todo_etag(todo_model.id, todo_model.version),
+            "Cache-Control": "private, no-cache",
+        }
+        if etag_matches(request.headers.get("If-None-Match"), headers["ETag"]):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        response.headers.update(headers)
         return todo_model
     raise HTTPException(
-        status_code=status.HTTP_404_NOT_FOUND, details="Todo not found."
+        status_code=status.HTTP_404_NOT_FOUND, detail="Todo not found."
     )
 
 
@@ -93,40 +403,247 @@ async def create_todo(
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication Failed"
         )
-    todo_model = Todos(**todo_request.model_dump(), owner_id=user.get("id"))
+    version = await next_version(db, user.get("id"))
+    todo_model = Todos(**todo_request.model_dump(), owner_id=user.get("id"), version=version)
     db.add(todo_model)
-    db.commit()
+    await db.commit()
+    changes_committed(user.get("id"))
 
 
 @router.put("/Todos/{id}", status_code=status.HTTP_204_NO_CONTENT)
 async def update_todo(
-    db: db_dependency, todo_request: TodoRequest, id: int = Path(gt=0)
+    user: user_dependency,
+    db: db_dependency,
+    todo_request: TodoRequest,
+    id: int = Path(gt=0),
 ):
-    todo_model = db.query(Todos).filter(Todos.id == id).first()
-
-    if todo_model is None:
+    if user is None:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, details="Todo not found."
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication Failed"
         )
 
-    todo_model.title = todo_request.title
-    todo_model.description = todo_request.description
-    todo_model.priority = todo_request.priority
-    todo_model.complete = todo_request.complete
+    # One UPDATE ... RETURNING instead of loading the row first. On a 404 the
+    # counter bump is rolled back with everything else.
+    version = await next_version(db, user.get("id"))
+    updated = await db.scalar(
+        update(Todos)
+        .where(Todos.id == id, Todos.owner_id == user.get("id"))
+        .values(**todo_request.model_dump(), version=version)
+        .returning(Todos.id)
+        .execution_options(synchronize_session=False)
+    )
 
-    db.add(todo_model)
-    db.commit()
+    if updated is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Todo not found."
+        )
+
+    await db.commit()
+    changes_committed(user.get("id"))
 
 
 @router.delete("/Todos/{id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_todo(db: db_dependency, id: int = Path(gt=0)):
-    todo_model = db.query(Todos).filter(Todos.id == id).first()
+async def delete_todo(user: user_dependency, db: db_dependency, id: int = Path(gt=0)):
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication Failed"
+        )
+
+    # Counter first, like every other write, so concurrent writes to the same
+    # todo take their locks in the same order. A 404 rolls the bump back.
+    version = await next_version(db, user.get("id"))
+    deleted = await db.scalar(
+        delete(Todos)
+        .where(Todos.id == id, Todos.owner_id == user.get("id"))
+        .returning(Todos.id)
+        .execution_options(synchronize_session=False)
+    )
+
+    if deleted is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Todo not found."
+        )
+
+    await record_deletions(db, user.get("id"), version, [deleted])
+    await db.commit()
+    changes_committed(user.get("id"))
+
+
+@router.post("/Todos:batch", status_code=status.HTTP_200_OK, response_model=BatchResponse)
+async def create_todos_batch(
+    user: user_dependency,
+    db: db_dependency,
+    todo_requests: Annotated[
+        list[TodoRequest], Body(min_length=1, max_length=MAX_BATCH_SIZE)
+    ],
+):
+    """Creates every todo with one multi-row INSERT in a single transaction."""
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication Failed"
+        )
+
+    version = await next_version(db, user.get("id"))
+    rows = [
+        {**todo_request.model_dump(), "owner_id": user.get("id"), "version": version}
+        for todo_request in todo_requests
+    ]
+    ids = await db.scalars(
+        insert(Todos).returning(Todos.id, sort_by_parameter_order=True), rows
+    )
+    results = [{"id": id, "status": status.HTTP_201_CREATED} for id in ids]
+    await db.commit()
+    changes_committed(user.get("id"))
+    return {"results": results}
+
+
+@router.patch("/Todos:batch", status_code=status.HTTP_200_OK, response_model=BatchResponse)
+async def update_todos_batch(
+    user: user_dependency,
+    db: db_dependency,
+    todo_requests: Annotated[
+        list[TodoBatchUpdate], Body(min_length=1, max_length=MAX_BATCH_SIZE)
+    ],
+):
+    """Updates the user's todos with one executemany UPDATE in a single
+    transaction. Ids the user does not own come back as 404."""
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication Failed"
+        )
+
+    # Bumping the counter first takes the user's write lock (and SQLite's), so
+    # no other write can change these rows between the check and the UPDATE.
+    version = await next_version(db, user.get("id"))
+    owned = set(
+        await db.scalars(
+            select(Todos.id)
+            .where(
+                Todos.id.in_({todo_request.id for todo_request in todo_requests}),
+                Todos.owner_id == user.get("id"),
+            )
+            .with_for_update()
+        )
+    )
+    rows = [
+        {**todo_request.model_dump(exclude={"id"}), "b_id": todo_request.id, "version": version}
+        for todo_request in todo_requests
+        if todo_request.id in owned
+    ]
+    if rows:
+        # A Core executemany UPDATE; the owner is part of the statement itself.
+        todos = Todos.__table__
+        await db.execute(
+            update(todos).where(todos.c.id == bindparam("b_id"), todos.c.user_id == user.get("id")),
+            rows,
+        )
+        await db.commit()
+        changes_committed(user.get("id"))
+    else:
+        await db.rollback()
+
+    return {
+        "results": [
+            {
+                "id": todo_request.id,
+                "status": status.HTTP_204_NO_CONTENT
+                if todo_request.id in owned
+                else status.HTTP_404_NOT_FOUND,
+            }
+            for todo_request in todo_requests
+        ]
+    }
 
-    if todo_model is None:
+
+@router.delete("/Todos:batch", status_code=status.HTTP_200_OK, response_model=BatchResponse)
+async def delete_todos_batch(
+    user: user_dependency,
+    db: db_dependency,
+    ids: Annotated[list[int], Body(min_length=1, max_length=MAX_BATCH_SIZE)],
+):
+    """Deletes the user's todos with one DELETE ... WHERE id IN (...) statement.
+    Ids the user does not own come back as 404."""
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication Failed"
+        )
+
+    version = await next_version(db, user.get("id"))
+    deleted = set(
+        await db.scalars(
+            delete(Todos)
+            .where(Todos.id.in_(set(ids)), Todos.owner_id == user.get("id"))
+            .returning(Todos.id)
+            .execution_options(synchronize_session=False)
+        )
+    )
+    if deleted:
+        await record_deletions(db, user.get("id"), version, deleted)
+        await db.commit()
+        changes_committed(user.get("id"))
+    else:
+        await db.rollback()
+
+    return {
+        "results": [
+            {
+                "id": id,
+                "status": status.HTTP_204_NO_CONTENT
+                if id in deleted
+                else status.HTTP_404_NOT_FOUND,
+            }
+            for id in ids
+        ]
+    }
+
+
+@router.post("/Todos/import", status_code=status.HTTP_200_OK, response_model=ImportResponse)
+async def import_todos(
+    user: user_dependency,
+    db: db_dependency,
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+):
+    """Imports todos from an NDJSON or CSV upload (the same formats as
+    /Todos/export; ids and owners in the file are ignored). The body is parsed
+    as it arrives and inserted in batches, one transaction per batch. Invalid
+    rows are skipped and reported by line number."""
+    if user is None:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, details="Todo not found."
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication Failed"
         )
 
-    # db.query(Todos).filter(Todos.id == id).delete()
-    db.delete(todo_model)
-    db.commit()
+    imported = 0
+    errors = []
+    rows = []
+
+    async def flush():
+        nonlocal imported
+        if rows:
+            version = await next_version(db, user.get("id"))
+            await db.execute(insert(Todos), [{**row, "version": version} for row in rows])
+            await db.commit()
+            changes_committed(user.get("id"))
+            imported += len(rows)
+            rows.clear()
+
+    lines = import_lines(request.stream())
+    async for number, record in import_records(lines, format):
+        try:
+            if isinstance(record, Exception):
+                raise record
+            if not isinstance(record, dict):
+                raise ValueError("Expected an object.")
+            todo_request = TodoRequest.model_validate(
+                {field: record.get(field) for field in IMPORT_FIELDS}
+            )
+        except ValueError as exc:
+            if len(errors) < MAX_IMPORT_ERRORS:
+                errors.append(import_error(number, exc))
+            continue
+        rows.append({**todo_request.model_dump(), "owner_id": user.get("id")})
+        if len(rows) >= IMPORT_BATCH_SIZE:
+            await flush()
+    await flush()
+
+    return {"imported": imported, "errors": errors}
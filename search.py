@@ -0,0 +1,180 @@
+import asyncio
+import html
+import re
+import sys
+from sqlalchemy import text
+
+# Snippet markers are control characters so todo text can be HTML-escaped
+# before they are swapped for <mark> tags.
+MARK_START = "\x02"
+MARK_END = "\x03"
+
+# SQLite: an external-content FTS5 index over todos, kept in sync by triggers
+# so bulk INSERT/UPDATE/DELETE statements are covered as well as ORM writes.
+# The owner is indexed too, so a search only walks the user's own entries in
+# the inverted index instead of matching everyone's rows and filtering after.
+# Layout changes ship as a new step in migrations.py; these copies serve
+# `python search.py rebuild` and the tests, and must match the latest step.
+SQLITE_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS todos_fts USING fts5(
+        title, description, user_id, content='todos', content_rowid='id',
+        tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todos_fts_insert AFTER INSERT ON todos BEGIN
+        INSERT INTO todos_fts(rowid, title, description, user_id)
+        VALUES (new.id, new.title, new.description, new.user_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todos_fts_delete AFTER DELETE ON todos BEGIN
+        INSERT INTO todos_fts(todos_fts, rowid, title, description, user_id)
+        VALUES ('delete', old.id, old.title, old.description, old.user_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todos_fts_update
+    AFTER UPDATE OF title, description, user_id ON todos BEGIN
+        INSERT INTO todos_fts(todos_fts, rowid, title, description, user_id)
+        VALUES ('delete', old.id, old.title, old.description, old.user_id);
+        INSERT INTO todos_fts(rowid, title, description, user_id)
+        VALUES (new.id, new.title, new.description, new.user_id);
+    END
+    """,
+]
+
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS todos_fts_insert",
+    "DROP TRIGGER IF EXISTS todos_fts_delete",
+    "DROP TRIGGER IF EXISTS todos_fts_update",
+    "DROP TABLE IF EXISTS todos_fts",
+]
+
+SQLITE_SEARCH = text(
+    f"""
+    SELECT todos.id, todos.title, todos.description, todos.priority,
+           todos.complete, todos.user_id AS owner_id,
+           highlight(todos_fts, 0, '{MARK_START}', '{MARK_END}') AS title_snippet,
+           snippet(todos_fts, 1, '{MARK_START}', '{MARK_END}', '…', 16) AS description_snippet,
+           -bm25(todos_fts, 10.0, 1.0, 0.0) AS rank
+    FROM todos_fts JOIN todos ON todos.id = todos_fts.rowid
+    WHERE todos_fts MATCH :query AND todos.user_id = :owner_id
+    ORDER BY rank DESC, todos.id
+    LIMIT :limit
+    """
+)
+
+# Postgres: no shadow table needed, an expression GIN index is always current.
+POSTGRES_DOCUMENT = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+)
+
+POSTGRES_SCHEMA = [
+    f"CREATE INDEX IF NOT EXISTS ix_todos_search ON todos USING GIN (({POSTGRES_DOCUMENT}))",
+]
+
+POSTGRES_SEARCH = text(
+    f"""
+    SELECT todos.id, todos.title, todos.description, todos.priority,
+           todos.complete, todos.user_id AS owner_id,
+           ts_headline('english', coalesce(title, ''), query, :title_options) AS title_snippet,
+           ts_headline('english', coalesce(description, ''), query, :description_options)
+               AS description_snippet,
+           ts_rank({POSTGRES_DOCUMENT}, query) AS rank
+    FROM todos, websearch_to_tsquery('english', :query) AS query
+    WHERE ({POSTGRES_DOCUMENT}) @@ query AND todos.user_id = :owner_id
+    ORDER BY rank DESC, todos.id
+    LIMIT :limit
+    """
+)
+POSTGRES_HEADLINE = f"StartSel={MARK_START}, StopSel={MARK_END}"
+
+
+def create_search_index(connection):
+    """Creates the full-text index for the connection's dialect (sync, for run_sync)."""
+    statements = {"sqlite": SQLITE_SCHEMA, "postgresql": POSTGRES_SCHEMA}.get(
+        connection.dialect.name, []
+    )
+    for statement in statements:
+        connection.execute(text(statement))
+
+
+def drop_search_index(connection):
+    """Drops SQLite's index and triggers so create_search_index() can build
+    them with a new layout. Postgres's expression index needs no rebuild."""
+    if connection.dialect.name == "sqlite":
+        for statement in SQLITE_DROP:
+            connection.execute(text(statement))
+
+
+def rebuild_search_index(connection):
+    """Re-indexes every existing todo, e.g. rows written before the index existed."""
+    if connection.dialect.name == "sqlite":
+        connection.execute(text("INSERT INTO todos_fts(todos_fts) VALUES ('rebuild')"))
+    elif connection.dialect.name == "postgresql":
+        connection.execute(text("REINDEX INDEX ix_todos_search"))
+
+
+def sqlite_match_query(owner_id: int, query: str) -> str:
+    # Quote every word so user input can never be parsed as FTS5 syntax; the
+    # last word also matches as a prefix to support search-as-you-type.
+    words = re.findall(r"\w+", query)
+    if not words:
+        return ""
+    terms = " ".join(f'"{word}"' for word in words) + "*"
+    return f'user_id:"{int(owner_id)}" AND {{title description}}: ({terms})'
+
+
+def mark_snippet(snippet: str) -> str:
+    escaped = html.escape(snippet or "")
+    return escaped.replace(MARK_START, "<mark>").replace(MARK_END, "</mark>")
+
+
+async def search_todos(db, owner_id: int, query: str, limit: int) -> list[dict]:
+    if db.bind.dialect.name == "postgresql":
+        result = await db.execute(
+            POSTGRES_SEARCH,
+            {
+                "query": query,
+                "owner_id": owner_id,
+                "limit": limit,
+                "title_options": f"{POSTGRES_HEADLINE}, HighlightAll=true",
+                "description_options": f"{POSTGRES_HEADLINE}, MaxWords=16, MinWords=8",
+            },
+        )
+    else:
+        match = sqlite_match_query(owner_id, query)
+        if not match:
+            return []
+        result = await db.execute(
+            SQLITE_SEARCH, {"query": match, "owner_id": owner_id, "limit": limit}
+        )
+
+    rows = []
+    for row in result.mappings():
+        row = dict(row)
+        row["complete"] = bool(row["complete"])
+        row["title_snippet"] = mark_snippet(row["title_snippet"])
+        row["description_snippet"] = mark_snippet(row["description_snippet"])
+        rows.append(row)
+    return rows
+
+
+async def rebuild():
+    from db import engine
+
+    async with engine.begin() as connection:
+        await connection.run_sync(drop_search_index)
+        await connection.run_sync(create_search_index)
+        await connection.run_sync(rebuild_search_index)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("usage: python search.py rebuild")
+    asyncio.run(rebuild())
+    print("Search index rebuilt.")
@@ -0,0 +1,92 @@
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+
+def env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+def env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+def env_bool(name: str, default: Optional[bool]) -> Optional[bool]:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+@dataclass(frozen=True)
+class Settings:
+    secret_key: Optional[str]
+    algorithm: Optional[str]
+    database_url: str
+    db_pool_size: int
+    db_max_overflow: int
+    db_pool_recycle: int
+    db_pool_timeout: int
+    # Test pooled connections with a round trip before use. Unset: only for
+    # network databases, where connections can go stale; a local SQLite file can't.
+    db_pool_pre_ping: Optional[bool]
+    # Run pending migrations in the app lifespan. Turn off when they are run as
+    # a deploy step (`python migrations.py`) instead.
+    auto_migrate: bool
+    bcrypt_rounds: int
+    password_hash_workers: int
+    password_hash_max_pending: int
+    token_cache_size: int
+    template_cache_dir: str
+    page_cache_users: int
+    page_cache_pages_per_user: int
+    slow_request_seconds: Optional[float]
+    # Token buckets: sustained requests per second and burst size. 0 = off.
+    auth_rate_per_second: float
+    auth_burst: float
+    user_rate_per_second: float
+    user_burst: float
+    rate_limit_max_keys: int
+    # Requests in flight per worker before new ones get a 503. 0 = no cap.
+    max_concurrent_requests: int
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        hash_workers = env_int("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1))
+        slow_request_seconds = os.environ.get("SLOW_REQUEST_SECONDS")
+        return cls(
+            secret_key=os.environ.get("SECRET_KEY"),
+            algorithm=os.environ.get("ALGORITHM"),
+            database_url=os.environ.get("DATABASE_URL", "sqlite:///./todosapp.db"),
+            db_pool_size=env_int("DB_POOL_SIZE", 5),
+            db_max_overflow=env_int("DB_MAX_OVERFLOW", 10),
+            db_pool_recycle=env_int("DB_POOL_RECYCLE", 1800),
+            db_pool_timeout=env_int("DB_POOL_TIMEOUT", 30),
+            db_pool_pre_ping=env_bool("DB_POOL_PRE_PING", None),
+            auto_migrate=env_bool("AUTO_MIGRATE", True),
+            bcrypt_rounds=env_int("BCRYPT_ROUNDS", 12),
+            password_hash_workers=hash_workers,
+            password_hash_max_pending=env_int("PASSWORD_HASH_MAX_PENDING", hash_workers * 8),
+            token_cache_size=env_int("TOKEN_CACHE_SIZE", 10000),
+            template_cache_dir=os.environ.get("TEMPLATE_CACHE_DIR", ".jinja_cache"),
+            page_cache_users=env_int("PAGE_CACHE_USERS", 1024),
+            page_cache_pages_per_user=env_int("PAGE_CACHE_PAGES_PER_USER", 32),
+            slow_request_seconds=float(slow_request_seconds) if slow_request_seconds else None,
+            # Ten logins a minute per IP, five at once.
+            auth_rate_per_second=env_float("AUTH_RATE_PER_SECOND", 10 / 60),
+            auth_burst=env_float("AUTH_BURST", 5),
+            user_rate_per_second=env_float("USER_RATE_PER_SECOND", 20),
+            user_burst=env_float("USER_BURST", 50),
+            rate_limit_max_keys=env_int("RATE_LIMIT_MAX_KEYS", 100_000),
+            max_concurrent_requests=env_int("MAX_CONCURRENT_REQUESTS", 256),
+        )
+
+
+@lru_cache
+def get_settings() -> Settings:
+    """Reads .env and the environment once per process."""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    return Settings.from_env()
@@ -0,0 +1,186 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from jinja2 import pass_context
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, PlainTextResponse, Response
+from etags import etag_matches
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; without it only gzip variants are built.
+    brotli = None
+
+STATIC_DIRECTORY = "static"
+BUILD_DIRECTORY = "static_build"
+# Files smaller than this are not worth a compressed variant.
+MIN_COMPRESS_SIZE = 1024
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+@dataclass
+class Asset:
+    path: str
+    hashed_path: str
+    digest: str
+    media_type: str
+    # Content-Encoding -> file on disk, in order of preference.
+    variants: dict[str, Path] = field(default_factory=dict)
+
+
+class AssetPipeline:
+    """Fingerprints and precompresses everything under `directory`.
+
+    Each file gets a content-hash name (`bootstrap.css` -> `bootstrap.<hash>.css`)
+    and, when compressible, brotli and gzip variants written to `build_directory`.
+    Variants are named after the hash, so a rebuild only compresses changed files.
+    """
+
+    def __init__(self, directory: str = STATIC_DIRECTORY, build_directory: str = BUILD_DIRECTORY):
+        self.directory = Path(directory)
+        self.build_directory = Path(build_directory)
+        self.assets: dict[str, Asset] = {}
+        self.lock = threading.Lock()
+        self.built = False
+
+    def build(self):
+        with self.lock:
+            self.scan()
+
+    def scan(self):
+        assets = {}
+        for file in sorted(self.directory.rglob("*")):
+            if file.is_file():
+                asset = self.build_asset(file)
+                assets[asset.path] = asset
+                assets[asset.hashed_path] = asset
+        self.assets = assets
+        self.built = True
+
+    def build_asset(self, file: Path) -> Asset:
+        data = file.read_bytes()
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        path = file.relative_to(self.directory).as_posix()
+        stem, dot, suffix = path.rpartition(".")
+        hashed_path = f"{stem}.{digest}.{suffix}" if dot else f"{path}.{digest}"
+        media_type = mimetypes.guess_type(file.name)[0] or "application/octet-stream"
+
+        variants = {}
+        if len(data) >= MIN_COMPRESS_SIZE and media_type.startswith(COMPRESSIBLE_TYPES):
+            if brotli is not None:
+                self.add_variant(variants, "br", hashed_path, data, brotli.compress)
+            self.add_variant(
+                variants, "gzip", hashed_path, data, lambda raw: gzip.compress(raw, 9, mtime=0)
+            )
+        variants["identity"] = file
+        return Asset(path, hashed_path, digest, media_type, variants)
+
+    def add_variant(self, variants, encoding, hashed_path, data, compress):
+        extension = {"br": ".br", "gzip": ".gz"}[encoding]
+        target = self.build_directory / (hashed_path + extension)
+        if not target.exists():
+            compressed = compress(data)
+            if len(compressed) >= len(data):
+                return
+            target.parent.mkdir(parents=True, exist_ok=True)
+            # Write then rename so concurrent workers never serve a partial file.
+            temporary = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+            temporary.write_bytes(compressed)
+            os.replace(temporary, target)
+        variants[encoding] = target
+
+    def get(self, path: str):
+        if not self.built:
+            with self.lock:
+                if not self.built:
+                    self.scan()
+        return self.assets.get(path.lstrip("/"))
+
+    def hashed_path(self, path: str) -> str:
+        asset = self.get(path)
+        return asset.hashed_path if asset is not None else path.lstrip("/")
+
+
+def accepted_encodings(accept_encoding: str) -> set[str]:
+    accepted = set()
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+class StaticAssets:
+    """ASGI app serving an AssetPipeline.
+
+    Hashed paths are served as immutable; original paths still work but must
+    revalidate. The precompressed variant matching Accept-Encoding is sent with
+    a strong ETag per encoding, and If-None-Match is answered with 304.
+    """
+
+    def __init__(self, pipeline: AssetPipeline):
+        self.pipeline = pipeline
+
+    async def __call__(self, scope, receive, send):
+        response = self.get_response(scope)
+        await response(scope, receive, send)
+
+    def get_response(self, scope) -> Response:
+        if scope["method"] not in ("GET", "HEAD"):
+            return PlainTextResponse("Method Not Allowed", status_code=405)
+        path = scope["path"][len(scope.get("root_path", "")):]
+        asset = self.pipeline.get(path)
+        if asset is None:
+            return PlainTextResponse("Not Found", status_code=404)
+
+        request_headers = Headers(scope=scope)
+        accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+        encoding = next(
+            coding for coding in asset.variants if coding == "identity" or coding in accepted
+        )
+        headers = {
+            "etag": f'"{asset.digest}-{encoding}"',
+            "vary": "Accept-Encoding",
+            "cache-control": IMMUTABLE_CACHE_CONTROL
+            if path.lstrip("/") == asset.hashed_path
+            else REVALIDATE_CACHE_CONTROL,
+        }
+        if encoding != "identity":
+            headers["content-encoding"] = encoding
+
+        if etag_matches(request_headers.get("if-none-match"), headers["etag"]):
+            return Response(status_code=304, headers=headers)
+
+        return FileResponse(
+            asset.variants[encoding], media_type=asset.media_type, headers=headers
+        )
+
+
+assets = AssetPipeline()
+
+
+@pass_context
+def static_url(context, path: str):
+    """Template helper: URL of the fingerprinted copy of a static file."""
+    return context["request"].url_for("static", path=assets.hashed_path(path))
+
+
+if __name__ == "__main__":
+    # Prebuild variants at deploy time so the first app start does no compression.
+    assets.build()
+    print(f"Built {len(assets.assets) // 2} assets into {assets.build_directory}/")
@@ -0,0 +1,120 @@
+import asyncio
+import time
+from datetime import timedelta
+import passwords
+import token_cache
+from routers import auth
+from routers.auth import authenticate_user, create_access_token, get_current_user
+from fastapi import HTTPException, status
+from jose import jwt
+from .utils import *
+
+
+def authenticate(username, password):
+    async def run():
+        async with AsyncTestingSessionLocal() as db:
+            return await authenticate_user(username, password, db)
+
+    return asyncio.run(run())
+
+
+def test_authenticate_user(test_user):
+    user = authenticate(test_user.username, "testpassword")
+    assert user.username == test_user.username
+
+    assert authenticate("WrongUserName", "testpassword") is False
+    assert authenticate(test_user.username, "wrongpassword") is False
+
+
+def test_authenticate_user_rehashes_weak_hash(test_user):
+    bcrypt_context = get_bcrypt_context()
+    weak_hash = bcrypt_context.handler().using(rounds=4).hash("testpassword")
+    db = TestingSessionLocal()
+    db.query(Users).filter(Users.id == test_user.id).update(
+        {"hashed_password": weak_hash}
+    )
+    db.commit()
+
+    authenticate(test_user.username, "testpassword")
+
+    db.expire_all()
+    stored = db.query(Users).filter(Users.id == test_user.id).first().hashed_password
+    db.close()
+    assert stored != weak_hash
+    assert bcrypt_context.verify("testpassword", stored)
+    assert not bcrypt_context.needs_update(stored)
+
+
+def test_hash_pool_rejects_when_saturated():
+    passwords.pending = passwords.HASH_MAX_PENDING
+    try:
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(passwords.hash_password("testpassword"))
+    finally:
+        passwords.pending = 0
+    assert exc.value.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert exc.value.headers == {"Retry-After": "1"}
+
+
+@pytest.fixture
+def jwt_settings(monkeypatch):
+    monkeypatch.setattr(auth, "SECRET_KEY", "testsecret")
+    monkeypatch.setattr(auth, "ALGORITHM", "HS256")
+    token_cache.token_cache.clear()
+    yield
+    token_cache.token_cache.clear()
+    token_cache.set_revocation_check(None)
+
+
+def test_get_current_user_valid_token(jwt_settings):
+    token = create_access_token("testuser", 1, timedelta(minutes=20))
+
+    user = asyncio.run(get_current_user(token=token))
+    assert user == {"username": "testuser", "id": 1}
+    assert token_cache.token_cache.stats() == {"size": 1, "hits": 0, "misses": 1}
+
+    assert asyncio.run(get_current_user(token=token)) == user
+    assert token_cache.token_cache.stats() == {"size": 1, "hits": 1, "misses": 1}
+
+
+def test_get_current_user_missing_payload(jwt_settings):
+    token = jwt.encode({"role": "user"}, "testsecret", algorithm="HS256")
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(get_current_user(token=token))
+    assert exc.value.status_code == status.HTTP_401_UNAUTHORIZED
+    assert exc.value.detail == "Could not validate user."
+
+
+def test_get_current_user_expired_token_not_served_from_cache(jwt_settings):
+    token = create_access_token("testuser", 1, timedelta(minutes=-1))
+
+    with pytest.raises(HTTPException):
+        asyncio.run(get_current_user(token=token))
+    assert token_cache.token_cache.stats()["size"] == 0
+
+
+def test_get_current_user_revoked_cached_token(jwt_settings):
+    token = create_access_token("testuser", 1, timedelta(minutes=20))
+    asyncio.run(get_current_user(token=token))
+
+    revoked = {token_cache.token_digest(token)}
+    token_cache.set_revocation_check(lambda digest, claims: digest in revoked)
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(get_current_user(token=token))
+    assert exc.value.status_code == status.HTTP_401_UNAUTHORIZED
+    assert token_cache.token_cache.stats()["size"] == 0
+
+
+def test_token_cache_evicts_least_recently_used():
+    cache = token_cache.TokenCache(maxsize=2)
+    expires_at = time.time() + 60
+    cache.put("a", {"id": 1}, expires_at)
+    cache.put("b", {"id": 2}, expires_at)
+    cache.get("a")
+    cache.put("c", {"id": 3}, expires_at)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == {"id": 1}
+    assert cache.get("c") == {"id": 3}
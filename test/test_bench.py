@@ -0,0 +1,44 @@
+from benchmarks.bench import compare, percentile, summarise
+
+
+def test_percentile_nearest_rank():
+    samples = [float(value) for value in range(1, 101)]
+    assert percentile(samples, 0.50) == 50.0
+    assert percentile(samples, 0.95) == 95.0
+    assert percentile(samples, 0.99) == 99.0
+    assert percentile([0.2], 0.99) == 0.2
+    assert percentile([], 0.5) == 0.0
+
+
+def test_summarise():
+    summary = summarise([0.01, 0.02, 0.03, 0.04], errors=1, rejected=0, elapsed=2.0)
+    assert summary == {
+        "requests": 4,
+        "errors": 1,
+        "rejected": 0,
+        "rps": 2.0,
+        "p50_ms": 20.0,
+        "p95_ms": 40.0,
+        "p99_ms": 40.0,
+    }
+
+
+def test_compare_flags_regressions_beyond_tolerance():
+    baseline = {
+        "scenarios": {
+            "get": {"rps": 100.0, "p95_ms": 10.0, "errors": 0},
+            "list_50": {"rps": 100.0, "p95_ms": 10.0, "errors": 0},
+        }
+    }
+    results = {
+        "scenarios": {
+            "get": {"rps": 95.0, "p95_ms": 11.0, "errors": 0},
+            "list_50": {"rps": 70.0, "p95_ms": 15.0, "errors": 2},
+            "static": {"rps": 1.0, "p95_ms": 999.0, "errors": 0},
+        }
+    }
+    assert compare(results, baseline, tolerance=0.2) == [
+        "list_50: p95 10.0ms -> 15.0ms",
+        "list_50: 100.0 -> 70.0 req/s",
+        "list_50: errors 0 -> 2",
+    ]
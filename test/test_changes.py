@@ -0,0 +1,176 @@
+import asyncio
+from sqlalchemy import event
+from changes import changes_committed, next_version, read_changes
+import routers.todos
+from routers.todos import change_events, decode_cursor, get_db, get_current_user
+from fastapi import status
+from .utils import *
+
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_current_user] = override_get_current_user
+
+NEW_TODO = {"title": "New todo", "description": "Written after the cursor", "priority": 2, "complete": False}
+
+
+def test_read_all_answers_304_until_something_changes(test_todo):
+    response = client.get("/Todos", params={"limit": 10})
+    etag = response.headers["ETag"]
+    assert response.headers["Cache-Control"] == "private, no-cache"
+
+    response = client.get("/Todos", params={"limit": 10}, headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.content == b""
+    # Different query parameters are a different representation.
+    assert client.get("/Todos", params={"limit": 5}, headers={"If-None-Match": etag}).status_code == 200
+
+    client.post("/Todos", json=NEW_TODO)
+    response = client.get("/Todos", params={"limit": 10}, headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["ETag"] != etag
+    assert len(response.json()["items"]) == 2
+
+
+def test_read_one_answers_304_until_the_todo_changes(test_todo):
+    etag = client.get(f"/Todos/{test_todo.id}").headers["ETag"]
+    response = client.get(f"/Todos/{test_todo.id}", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    client.put(f"/Todos/{test_todo.id}", json={**NEW_TODO, "complete": True})
+    response = client.get(f"/Todos/{test_todo.id}", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["complete"] is True
+
+
+def test_changes_since_cursor_include_tombstones(test_todo):
+    response = client.get("/Todos/changes")
+    assert response.status_code == status.HTTP_200_OK
+    feed = response.json()
+    assert [change["id"] for change in feed["changes"]] == [test_todo.id]
+    assert feed["has_more"] is False
+    cursor = feed["next_cursor"]
+
+    client.post("/Todos", json=NEW_TODO)
+    client.put(f"/Todos/{test_todo.id}", json=NEW_TODO)
+    client.delete(f"/Todos/{test_todo.id}")
+
+    feed = client.get("/Todos/changes", params={"since": cursor}).json()
+    created, deleted = feed["changes"]
+    assert created["deleted"] is False
+    assert created["todo"]["title"] == "New todo"
+    assert deleted == {"id": test_todo.id, "version": 3, "deleted": True, "todo": None}
+
+    # Nothing new: an empty page that keeps the cursor.
+    again = client.get("/Todos/changes", params={"since": feed["next_cursor"]}).json()
+    assert again == {"changes": [], "next_cursor": feed["next_cursor"], "has_more": False}
+
+
+def test_changes_committed_between_feed_queries_are_not_skipped(test_todo):
+    other = Todos(**NEW_TODO, owner_id=1)
+    db = TestingSessionLocal()
+    db.add(other)
+    db.commit()
+    cursor = client.get("/Todos/changes").json()["next_cursor"]
+
+    written = []
+
+    def write_between_queries(conn, cursor, statement, parameters, context, executemany):
+        if "FROM todo_tombstones" not in statement or written:
+            return
+        written.append(True)
+        with engine.begin() as connection:
+            # An update at version 1, then a delete at version 2.
+            connection.execute(text("INSERT INTO change_counters (owner_id, version) VALUES (1, 2)"))
+            connection.execute(
+                text("UPDATE todos SET complete = 1, version = 1 WHERE id = :id"), {"id": test_todo.id}
+            )
+            connection.execute(text("DELETE FROM todos WHERE id = :id"), {"id": other.id})
+            connection.execute(
+                text("INSERT INTO todo_tombstones (owner_id, version, todo_id) VALUES (1, 2, :id)"),
+                {"id": other.id},
+            )
+
+    async def poll(after):
+        async with AsyncTestingSessionLocal() as session:
+            changes, _ = await read_changes(session, 1, after, 100)
+            return changes
+
+    after = decode_cursor("changes", cursor, 2)
+    event.listen(async_engine.sync_engine, "before_cursor_execute", write_between_queries)
+    try:
+        first = asyncio.run(poll(after))
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", write_between_queries)
+    assert written
+    if first:
+        after = [first[-1]["version"], first[-1]["id"]]
+    second = asyncio.run(poll(after))
+    db.close()
+
+    seen = {(change["id"], change["version"], change["deleted"]) for change in first + second}
+    assert seen == {(test_todo.id, 1, False), (other.id, 2, True)}
+
+
+def test_changes_page_through_a_batch(many_todos):
+    cursor = client.get("/Todos/changes", params={"limit": 200}).json()["next_cursor"]
+    db = TestingSessionLocal()
+    ids = sorted(id for id, in db.query(Todos.id).filter(Todos.owner_id == 1).limit(3))
+    db.close()
+    # One transaction, so all three rows share a version.
+    client.patch("/Todos:batch", json=[{**NEW_TODO, "id": id} for id in ids])
+
+    seen = []
+    while True:
+        feed = client.get("/Todos/changes", params={"since": cursor, "limit": 2}).json()
+        seen.extend(change["id"] for change in feed["changes"])
+        cursor = feed["next_cursor"]
+        if not feed["has_more"]:
+            break
+    assert seen == ids
+
+
+def test_changes_rejects_invalid_cursor():
+    response = client.get("/Todos/changes", params={"since": "not-a-cursor"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+class ConnectedRequest:
+    async def is_disconnected(self):
+        return False
+
+
+def test_change_stream_pushes_commits(test_todo):
+    async def scenario():
+        async with AsyncTestingSessionLocal() as db, AsyncTestingSessionLocal() as writer:
+            events = change_events(ConnectedRequest(), db, 1, None)
+            first = await anext(events)
+
+            pending = asyncio.ensure_future(anext(events))
+            await asyncio.sleep(0.05)
+            assert not pending.done()
+
+            writer.add(Todos(**NEW_TODO, owner_id=1, version=await next_version(writer, 1)))
+            await writer.commit()
+            changes_committed(1)
+            second = await asyncio.wait_for(pending, 5)
+            await events.aclose()
+            return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first.startswith("id: ")
+    assert "event: changes" in first
+    assert f'"id":{test_todo.id}' in first
+    assert '"title":"New todo"' in second
+
+
+def test_idle_change_stream_sends_keep_alive(test_todo, monkeypatch):
+    monkeypatch.setattr(routers.todos, "STREAM_HEARTBEAT_SECONDS", 0.01)
+
+    async def scenario():
+        async with AsyncTestingSessionLocal() as db:
+            events = change_events(ConnectedRequest(), db, 1, None)
+            await anext(events)
+            keep_alive = await asyncio.wait_for(anext(events), 5)
+            await events.aclose()
+            return keep_alive
+
+    assert asyncio.run(scenario()) == ": keep-alive\n\n"
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import metrics
+import passwords
+from routers.todos import get_db, get_current_user
+from fastapi import status
+from .utils import *
+
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_current_user] = override_get_current_user
+
+
+def sample(text, prefix):
+    for line in text.splitlines():
+        if line.startswith(prefix + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+
+def test_metrics_record_route_latency_and_sql(test_todo):
+    before = client.get("/metrics").text
+    requests_before = sample(
+        before, 'http_requests_total{method="GET",route="/Todos/{id}",status="200"}'
+    ) or 0
+
+    response = client.get(f"/Todos/{test_todo.id}")
+    assert response.status_code == status.HTTP_200_OK
+
+    response = client.get("/metrics")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    assert (
+        sample(text, 'http_requests_total{method="GET",route="/Todos/{id}",status="200"}')
+        == requests_before + 1
+    )
+    assert sample(
+        text,
+        'http_request_duration_seconds_bucket{method="GET",route="/Todos/{id}",le="+Inf"}',
+    )
+    assert sample(text, 'http_request_sql_queries_sum{route="/Todos/{id}"}') >= 1
+    assert "# TYPE db_statement_duration_seconds histogram" in text
+    assert 'cache_stats{cache="token",stat="hits"}' in text
+
+
+def test_auth_spans_recorded():
+    asyncio.run(passwords.hash_password("testpassword"))
+    text = metrics.render()
+    assert sample(text, 'auth_duration_seconds_count{operation="bcrypt_hash"}') >= 1
+
+
+def test_slow_request_log_includes_sql(test_todo, monkeypatch, caplog):
+    monkeypatch.setattr(metrics, "SLOW_REQUEST_SECONDS", 0.0)
+    with caplog.at_level(logging.WARNING, logger="todos.slow_requests"):
+        client.get(f"/Todos/{test_todo.id}")
+    assert any(
+        "Slow request GET /Todos/" in record.getMessage()
+        and "SELECT" in record.getMessage()
+        for record in caplog.records
+    )
+
+
+def test_failed_statements_leave_no_timing_state():
+    sync_engine = create_engine("sqlite://")
+    instrument_engine(sync_engine)
+    with sync_engine.connect() as connection:
+        with pytest.raises(Exception):
+            connection.execute(text("SELECT * FROM missing_table"))
+        connection.rollback()
+        connection.execute(text("SELECT 1"))
+        assert "query_started" not in connection.connection.info
+    sync_engine.dispose()
+
+
+def test_histogram_render_is_cumulative():
+    histogram = metrics.Histogram("example_seconds", "Example.", ("route",), (0.1, 1.0))
+    histogram.observe(0.05, "/a")
+    histogram.observe(0.5, "/a")
+    histogram.observe(5.0, "/a")
+    assert histogram.render() == [
+        "# HELP example_seconds Example.",
+        "# TYPE example_seconds histogram",
+        'example_seconds_bucket{route="/a",le="0.1"} 1',
+        'example_seconds_bucket{route="/a",le="1.0"} 2',
+        'example_seconds_bucket{route="/a",le="+Inf"} 3',
+        'example_seconds_sum{route="/a"} 5.55',
+        'example_seconds_count{route="/a"} 3',
+    ]
@@ -0,0 +1,137 @@
+import asyncio
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+import migrations
+from migrations import LATEST_VERSION, run_migrations
+from .utils import *
+
+
+def migrate_concurrently(url, workers):
+    async def run():
+        engines = [create_async_engine(url, poolclass=NullPool) for _ in range(workers)]
+        try:
+            return await asyncio.gather(*(run_migrations(engine) for engine in engines))
+        finally:
+            for engine in engines:
+                await engine.dispose()
+
+    return asyncio.run(run())
+
+
+def test_migrations_apply_once_across_workers(tmp_path):
+    url = f"sqlite+aiosqlite:///{tmp_path / 'migrate.db'}"
+
+    results = migrate_concurrently(url, 3)
+    assert sorted(results, key=len) == [[], [], list(range(1, LATEST_VERSION + 1))]
+
+    assert migrate_concurrently(url, 1) == [[]]
+
+    sync_engine = create_engine(url.replace("+aiosqlite", ""))
+    tables = inspect(sync_engine).get_table_names()
+    assert {"users", "todos", "todos_fts", "schema_version"} <= set(tables)
+    with sync_engine.connect() as connection:
+        assert connection.execute(text("SELECT version FROM schema_version")).all() == [
+            (LATEST_VERSION,)
+        ]
+    sync_engine.dispose()
+
+
+def test_migrations_upgrade_existing_database(tmp_path):
+    # A database made by the old import-time create_all: tables, no indexes, no version.
+    path = tmp_path / "legacy.db"
+    sync_engine = create_engine(f"sqlite:///{path}")
+    with sync_engine.begin() as connection:
+        connection.execute(
+            text(
+                "CREATE TABLE todos (id INTEGER PRIMARY KEY, title VARCHAR, "
+                "description VARCHAR, priority INTEGER, complete BOOLEAN, user_id INTEGER)"
+            )
+        )
+        connection.execute(
+            text("INSERT INTO todos (title, description, priority, complete, user_id) "
+                 "VALUES ('Old todo', 'Made before migrations', 1, 0, 1)")
+        )
+
+    assert migrate_concurrently(f"sqlite+aiosqlite:///{path}", 1) == [
+        list(range(1, LATEST_VERSION + 1))
+    ]
+
+    indexes = {index["name"] for index in inspect(sync_engine).get_indexes("todos")}
+    assert {"ix_todos_owner_complete_priority_id", "ix_todos_owner_version_id"} <= indexes
+    with sync_engine.connect() as connection:
+        assert connection.execute(text("SELECT title, version FROM todos")).all() == [
+            ("Old todo", 0)
+        ]
+        assert connection.execute(
+            text("SELECT rowid FROM todos_fts WHERE todos_fts MATCH 'migrations'")
+        ).all() == [(1,)]
+    sync_engine.dispose()
+
+
+def test_migrations_wait_for_other_workers_past_driver_timeout(tmp_path, monkeypatch):
+    timeouts = []
+
+    def probe(connection):
+        timeouts.append(connection.exec_driver_sql("PRAGMA busy_timeout").scalar())
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", [(1, "probe", probe)])
+    url = f"sqlite+aiosqlite:///{tmp_path / 'timeout.db'}"
+
+    async def run():
+        engine = create_async_engine(url, pool_size=1)
+        try:
+            applied = await run_migrations(engine)
+            async with engine.connect() as connection:
+                restored = (await connection.exec_driver_sql("PRAGMA busy_timeout")).scalar()
+            return applied, restored
+        finally:
+            await engine.dispose()
+
+    applied, restored = asyncio.run(run())
+    assert applied == [1]
+    assert timeouts == [migrations.MIGRATION_BUSY_TIMEOUT_MS]
+    assert restored == 5000
+
+
+def test_migrations_build_the_model_schema(tmp_path):
+    url = f"sqlite+aiosqlite:///{tmp_path / 'schema.db'}"
+    migrate_concurrently(url, 1)
+
+    sync_engine = create_engine(url.replace("+aiosqlite", ""))
+    inspector = inspect(sync_engine)
+    for table in Base.metadata.sorted_tables:
+        columns = {column["name"]: column for column in inspector.get_columns(table.name)}
+        assert set(columns) == {column.name for column in table.columns}, table.name
+        for column in table.columns:
+            assert columns[column.name]["nullable"] == column.nullable, column
+        assert {index["name"] for index in inspector.get_indexes(table.name)} == {
+            index.name for index in table.indexes
+        }, table.name
+        assert (
+            inspector.get_pk_constraint(table.name)["constrained_columns"]
+            == [column.name for column in table.primary_key]
+        )
+    sync_engine.dispose()
+
+
+def test_migrations_build_the_current_search_index(tmp_path):
+    def search_schema(engine):
+        with engine.connect() as connection:
+            rows = connection.execute(
+                text("SELECT name, sql FROM sqlite_master WHERE name LIKE 'todos_fts%' AND sql IS NOT NULL")
+            )
+            return {name: " ".join(sql.split()) for name, sql in rows}
+
+    url = f"sqlite+aiosqlite:///{tmp_path / 'migrated.db'}"
+    migrate_concurrently(url, 1)
+    migrated = create_engine(url.replace("+aiosqlite", ""))
+
+    fresh = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    Base.metadata.create_all(bind=fresh)
+    with fresh.begin() as connection:
+        create_search_index(connection)
+
+    assert search_schema(migrated) == search_schema(fresh)
+    migrated.dispose()
+    fresh.dispose()
@@ -0,0 +1,124 @@
+import html
+import re
+from routers.pages import get_db, get_page_user
+from routers.todos import MAX_PAGE_SIZE, get_current_user
+from rendering import PageCache, page_cache
+from fastapi import status
+from .utils import *
+
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_page_user] = override_get_current_user
+app.dependency_overrides[get_current_user] = override_get_current_user
+
+
+@pytest.fixture(autouse=True)
+def clear_page_cache():
+    page_cache.clear()
+    yield
+    page_cache.clear()
+
+
+def test_todos_page_renders_user_todos(test_todo):
+    response = client.get("/pages/todos")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/html")
+    assert "Learn to code!" in response.text
+    assert f"/pages/todos/{test_todo.id}" in response.text
+
+
+def test_todos_page_served_from_cache_and_etag(test_todo):
+    first = client.get("/pages/todos")
+    second = client.get("/pages/todos")
+    assert page_cache.stats() == {"users": 1, "hits": 1, "misses": 1}
+    assert first.headers["etag"] == second.headers["etag"]
+
+    response = client.get(
+        "/pages/todos", headers={"If-None-Match": first.headers["etag"]}
+    )
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.content == b""
+
+
+@pytest.mark.parametrize("if_none_match", ['W/{etag}', '"other", {etag}', "*"])
+def test_todos_page_if_none_match_forms(test_todo, if_none_match):
+    etag = client.get("/pages/todos").headers["etag"]
+    response = client.get(
+        "/pages/todos", headers={"If-None-Match": if_none_match.format(etag=etag)}
+    )
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+def test_todos_page_invalidated_by_writes(test_todo):
+    etag = client.get("/pages/todos").headers["etag"]
+
+    response = client.put(
+        f"/Todos/{test_todo.id}",
+        json={
+            "title": "Changed title",
+            "description": "Need to learn everyday!",
+            "priority": 5,
+            "complete": True,
+        },
+    )
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+
+    response = client.get("/pages/todos", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert "Changed title" in response.text
+    assert response.headers["etag"] != etag
+
+
+def test_todos_page_retired_by_writes_from_other_workers(test_todo):
+    etag = client.get("/pages/todos").headers["etag"]
+    # Another worker's write: the row and the counter change, but this
+    # process's cache is never told.
+    with engine.begin() as connection:
+        connection.execute(
+            text("UPDATE todos SET title = 'Changed elsewhere' WHERE id = :id"),
+            {"id": test_todo.id},
+        )
+        connection.execute(text("INSERT INTO change_counters (owner_id, version) VALUES (1, 1)"))
+
+    response = client.get("/pages/todos", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert "Changed elsewhere" in response.text
+
+
+def test_page_cache_caps_pages_per_user():
+    cache = PageCache(maxusers=2, maxpages=2)
+    for key in ("a", "b", "c"):
+        cache.put(1, key, 0, key)
+    assert cache.get(1, "a", 0) is None
+    assert cache.get(1, "c", 0).html == "c"
+    assert cache.get(1, "c", 1) is None
+
+
+def test_todos_page_links_to_the_next_page(test_todo):
+    db = TestingSessionLocal()
+    db.add_all(
+        Todos(title=f"Paged {i}", description="Paged", priority=1, complete=False, owner_id=1)
+        for i in range(MAX_PAGE_SIZE + 49)
+    )
+    db.commit()
+    db.close()
+
+    first = client.get("/pages/todos")
+    assert first.text.count('href="http://testserver/pages/todos/') == MAX_PAGE_SIZE
+    next_link = re.search(r'href="http://testserver(/pages/todos\?after=[^"]+)">Next page', first.text)
+    assert next_link
+
+    second = client.get(html.unescape(next_link.group(1)))
+    assert second.status_code == status.HTTP_200_OK
+    assert second.text.count('href="http://testserver/pages/todos/') == 50
+    assert "Next page" not in second.text
+    assert "First page" in second.text
+    assert client.get("/pages/todos", params={"after": "bogus"}).status_code == 400
+
+
+def test_todo_page(test_todo):
+    response = client.get(f"/pages/todos/{test_todo.id}")
+    assert response.status_code == status.HTTP_200_OK
+    assert "Need to learn everyday!" in response.text
+
+    response = client.get("/pages/todos/999")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
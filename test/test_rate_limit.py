@@ -0,0 +1,118 @@
+import asyncio
+import rate_limit
+import routers.pages
+from routers.pages import get_page_user
+from routers.todos import get_db, get_current_user
+from fastapi import status
+from .utils import *
+
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_current_user] = override_get_current_user
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(rate_limit, "backend", rate_limit.MemoryBackend())
+    monkeypatch.setattr(rate_limit.auth_rate_limit, "rate", 1 / 60)
+    monkeypatch.setattr(rate_limit.auth_rate_limit, "burst", 2)
+    monkeypatch.setattr(rate_limit.user_rate_limit, "rate", 1 / 60)
+    monkeypatch.setattr(rate_limit.user_rate_limit, "burst", 2)
+
+
+def test_memory_backend_bucket_refills_and_evicts(monkeypatch):
+    now = 100.0
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now)
+    backend = rate_limit.MemoryBackend(max_keys=2)
+
+    take = lambda key: asyncio.run(backend.take(key, 0.5, 2))
+    assert take("a") == 0
+    assert take("a") == 0
+    assert take("a") == 2.0
+    now += 2
+    assert take("a") == 0
+
+    take("b")
+    take("c")
+    assert list(backend.buckets) == ["b", "c"]
+
+
+def test_login_is_limited_per_ip(limits):
+    form = {"username": "nobody", "password": "wrong"}
+    assert client.post("/auth/token", data=form).status_code == status.HTTP_401_UNAUTHORIZED
+    assert client.post("/auth/token", data=form).status_code == status.HTTP_401_UNAUTHORIZED
+
+    response = client.post("/auth/token", data=form)
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert response.headers["Retry-After"] == "60"
+
+
+def test_todos_are_limited_per_user(limits, test_todo):
+    assert client.get("/Todos").status_code == status.HTTP_200_OK
+    assert client.get(f"/Todos/{test_todo.id}").status_code == status.HTTP_200_OK
+
+    response = client.post(
+        "/Todos", json={"title": "One too many", "description": "Over the limit", "priority": 1, "complete": False}
+    )
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert "Retry-After" in response.headers
+    # Nothing was written.
+    db = TestingSessionLocal()
+    assert db.query(Todos).filter(Todos.title == "One too many").first() is None
+    db.close()
+
+
+
+def test_pages_share_the_user_limit(limits, test_todo, monkeypatch):
+    async def current_user(token):
+        return override_get_current_user()
+
+    monkeypatch.setattr(routers.pages, "get_current_user", current_user)
+    monkeypatch.delitem(app.dependency_overrides, get_page_user, raising=False)
+    client.cookies.set("access_token", "token")
+    try:
+        assert client.get("/Todos").status_code == status.HTTP_200_OK
+        assert client.get("/pages/todos").status_code == status.HTTP_200_OK
+
+        response = client.get(f"/pages/todos/{test_todo.id}")
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert "Retry-After" in response.headers
+    finally:
+        client.cookies.clear()
+
+def test_concurrency_cap_sheds_with_503():
+    release = asyncio.Event()
+
+    async def slow_app(scope, receive, send):
+        await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"done"})
+
+    middleware = rate_limit.ConcurrencyLimitMiddleware(slow_app, max_concurrent=1)
+
+    async def call(path):
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b""}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {"type": "http", "method": "GET", "path": path, "headers": []}
+        await middleware(scope, receive, send)
+        return messages[0]["status"], dict(messages[0]["headers"])
+
+    async def scenario():
+        first = asyncio.create_task(call("/Todos"))
+        await asyncio.sleep(0)
+        shed = await call("/Todos")
+        release.set()
+        # Health checks bypass the cap; the first request then completes.
+        assert (await call("/healthy"))[0] == 200
+        return (await first)[0], shed
+
+    first_status, (shed_status, shed_headers) = asyncio.run(scenario())
+    assert first_status == 200
+    assert shed_status == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert shed_headers[b"retry-after"] == b"1"
+    assert middleware.in_flight == 0
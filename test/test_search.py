@@ -0,0 +1,80 @@
+from routers.todos import get_db, get_current_user
+from fastapi import status
+from search import sqlite_match_query
+from .utils import *
+
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_current_user] = override_get_current_user
+
+
+def test_search_ranks_and_highlights(many_todos):
+    db = TestingSessionLocal()
+    db.add_all(
+        [
+            Todos(
+                title="Buy groceries",
+                description="Milk, eggs & <bread>",
+                priority=2,
+                complete=False,
+                owner_id=1,
+            ),
+            Todos(
+                title="Call mom",
+                description="Ask about the groceries list",
+                priority=3,
+                complete=False,
+                owner_id=1,
+            ),
+            Todos(
+                title="Groceries for someone else",
+                description="Not mine",
+                priority=1,
+                complete=False,
+                owner_id=2,
+            ),
+        ]
+    )
+    db.commit()
+
+    response = client.get("/Todos/search", params={"q": "groceries"})
+    assert response.status_code == status.HTTP_200_OK
+    results = response.json()
+    assert [result["title"] for result in results] == ["Buy groceries", "Call mom"]
+    assert results[0]["title_snippet"] == "Buy <mark>groceries</mark>"
+    assert results[0]["description_snippet"] == "Milk, eggs &amp; &lt;bread&gt;"
+    assert "<mark>groceries</mark>" in results[1]["description_snippet"]
+    assert results[0]["rank"] > results[1]["rank"]
+
+
+def test_search_follows_updates_and_deletes(test_todo):
+    assert len(client.get("/Todos/search", params={"q": "learn"}).json()) == 1
+
+    client.put(
+        f"/Todos/{test_todo.id}",
+        json={
+            "title": "Practice piano",
+            "description": "Scales every day",
+            "priority": 2,
+            "complete": False,
+        },
+    )
+    assert client.get("/Todos/search", params={"q": "learn"}).json() == []
+    assert len(client.get("/Todos/search", params={"q": "piano"}).json()) == 1
+
+    client.delete(f"/Todos/{test_todo.id}")
+    assert client.get("/Todos/search", params={"q": "piano"}).json() == []
+
+
+def test_search_prefix_and_syntax_safe(test_todo):
+    assert len(client.get("/Todos/search", params={"q": "lea"}).json()) == 1
+    response = client.get("/Todos/search", params={"q": 'learn" OR NEAR(*'})
+    assert response.status_code == status.HTTP_200_OK
+    assert client.get("/Todos/search", params={"q": "!!!"}).json() == []
+
+
+def test_sqlite_match_query():
+    assert (
+        sqlite_match_query(7, 'foo "bar" -baz')
+        == 'user_id:"7" AND {title description}: ("foo" "bar" "baz"*)'
+    )
+    assert sqlite_match_query(7, "  ") == ""
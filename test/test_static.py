@@ -0,0 +1,60 @@
+import pytest
+from fastapi import status
+from static_assets import assets, accepted_encodings
+from .utils import *
+
+
+def test_home_page_links_fingerprinted_assets():
+    response = client.get("/test")
+    assert response.status_code == status.HTTP_200_OK
+    hashed = assets.hashed_path("todo/css/bootstrap.css")
+    assert hashed != "todo/css/bootstrap.css"
+    assert f"/static/{hashed}" in response.text
+
+
+def test_hashed_asset_is_immutable_and_precompressed():
+    pytest.importorskip("brotli")
+    hashed = assets.hashed_path("todo/css/bootstrap.css")
+    with open("static/todo/css/bootstrap.css", "rb") as file:
+        original = file.read()
+
+    response = client.get(f"/static/{hashed}", headers={"Accept-Encoding": "br"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-encoding"] == "br"
+    assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert response.headers["content-type"].startswith("text/css")
+    assert response.headers["vary"] == "Accept-Encoding"
+
+    response = client.get(f"/static/{hashed}", headers={"Accept-Encoding": "gzip, br;q=0"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.content == original
+
+
+def test_asset_etag_not_modified():
+    hashed = assets.hashed_path("todo/js/popper.js")
+    response = client.get(f"/static/{hashed}", headers={"Accept-Encoding": "identity"})
+    etag = response.headers["etag"]
+    assert etag.startswith('"') and not etag.startswith("W/")
+    assert "content-encoding" not in response.headers
+
+    response = client.get(
+        f"/static/{hashed}",
+        headers={"Accept-Encoding": "identity", "If-None-Match": etag},
+    )
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.content == b""
+
+
+def test_original_path_must_revalidate():
+    response = client.get("/static/todo/css/base.css")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["cache-control"] == "no-cache"
+
+    response = client.get("/static/todo/css/missing.css")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_accepted_encodings():
+    assert accepted_encodings("gzip, deflate, br") == {"gzip", "deflate", "br"}
+    assert accepted_encodings("br;q=0, gzip;q=0.5") == {"gzip"}
+    assert accepted_encodings("") == set()
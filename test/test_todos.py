@@ -1,42 +1,249 @@
-# from sqlalchemy import create_engine
-# from sqlalchemy.pool import StaticPool
-# from sqlalchemy.orm import sessionmaker
-# from db import Base
-# from ..main import app
-# from fastapi.testclient import TestClient
-# from fastapi.testclient import status
+from routers.todos import encode_cursor, get_db, get_current_user
+from fastapi import status
+from .utils import *
 
-# SQLALCHEEMY_DATABASE_URL = "sqliite:///./testdb.db"
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_current_user] = override_get_current_user
 
-# engine = create_engine(
-#     SQLALCHEEMY_DATABASE_URL,
-#     connect_args={"check_same_thread": False},
-#     poorclass=StaticPool,  #! ?
-# )
 
-# TestingSessionLocal = sessionmaker(autocommit=False, autoFlush=False, bind=engine)
+def test_read_all_authenticated(test_todo):
+    response = client.get("/Todos")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {
+        "items": [
+            {
+                "id": test_todo.id,
+                "title": "Learn to code!",
+                "description": "Need to learn everyday!",
+                "priority": 5,
+                "complete": False,
+                "owner_id": 1,
+            }
+        ],
+        "next_cursor": None,
+    }
 
-# Base.metadata.create_all(bind=engine)
 
+def test_read_all_paginates_with_cursor(many_todos):
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 10}
+        if cursor:
+            params["after"] = cursor
+        response = client.get("/Todos", params=params)
+        assert response.status_code == status.HTTP_200_OK
+        page = response.json()
+        seen.extend(item["id"] for item in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert len(seen) == 25
+    assert seen == sorted(seen)
 
-# def override_get_db():
-#     db = TestingSessionLocal()
-#     try:
-#         yield db
-#     finally:
-#         db.close()
 
+def test_read_all_filters_and_sorts(many_todos):
+    response = client.get(
+        "/Todos", params={"complete": True, "sort": "-priority", "limit": 5}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    first = response.json()
+    assert all(item["complete"] for item in first["items"])
+    keys = [(item["priority"], item["id"]) for item in first["items"]]
+    assert keys == sorted(keys, reverse=True)
 
-# def override_get_current_user():
-#     return {"username": "JohnDoe", "id": 1, "user_role": "admin"}
+    response = client.get(
+        "/Todos",
+        params={
+            "complete": True,
+            "sort": "-priority",
+            "limit": 5,
+            "after": first["next_cursor"],
+        },
+    )
+    rest = [(item["priority"], item["id"]) for item in response.json()["items"]]
+    assert rest and max(rest) < min(keys)
 
+    response = client.get("/Todos", params={"priority": 3})
+    assert {item["priority"] for item in response.json()["items"]} == {3}
 
-# app.dependency_overrides[get_db] = override_get_db
-# app.dependency_overrides[get_current_user] = override_get_current_user
 
-# client = TestClient(app)
+def test_read_all_rejects_cursor_for_other_sort(many_todos):
+    cursor = client.get("/Todos", params={"limit": 5}).json()["next_cursor"]
+    response = client.get("/Todos", params={"sort": "priority", "after": cursor})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
 
 
-# def test_read_all_authenticated():
-#     response = client.get("/")
-#     assert response.status_code == status.HTTP_200_OK
+def test_read_all_rejects_garbage_cursor():
+    response = client.get("/Todos", params={"after": "not-a-cursor"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.parametrize("values", [[{"a": 1}], [[1, 2]], [10**30], ["1"], [True], [1.5]])
+def test_read_all_rejects_cursor_with_bad_values(values):
+    response = client.get("/Todos", params={"after": encode_cursor("id", values)})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = client.get(
+        "/Todos/changes", params={"since": encode_cursor("changes", values * 2)}
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_read_one_authenticated_not_found():
+    response = client.get("/Todos/999")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json() == {"detail": "Todo not found."}
+
+
+def test_update_todo(test_todo):
+    request_data = {
+        "title": "Change the title of the todo already saved!",
+        "description": "Need to learn everyday!",
+        "priority": 5,
+        "complete": False,
+    }
+
+    response = client.put(f"/Todos/{test_todo.id}", json=request_data)
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    db = TestingSessionLocal()
+    model = db.query(Todos).filter(Todos.id == test_todo.id).first()
+    assert model.title == "Change the title of the todo already saved!"
+
+
+def test_update_todo_not_found(test_todo):
+    request_data = {
+        "title": "Change the title of the todo already saved!",
+        "description": "Need to learn everyday!",
+        "priority": 5,
+        "complete": False,
+    }
+
+    response = client.put("/Todos/999", json=request_data)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json() == {"detail": "Todo not found."}
+
+
+def test_delete_todo(test_todo):
+    response = client.delete(f"/Todos/{test_todo.id}")
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    db = TestingSessionLocal()
+    model = db.query(Todos).filter(Todos.id == test_todo.id).first()
+    assert model is None
+
+
+def test_delete_todo_of_other_user(many_todos):
+    db = TestingSessionLocal()
+    other = db.query(Todos).filter(Todos.owner_id == 2).first()
+    response = client.delete(f"/Todos/{other.id}")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_create_todos_batch(test_todo):
+    request_data = [
+        {
+            "title": f"Batch todo {i}",
+            "description": "Created in one go",
+            "priority": 3,
+            "complete": False,
+        }
+        for i in range(3)
+    ]
+
+    response = client.post("/Todos:batch", json=request_data)
+    assert response.status_code == status.HTTP_200_OK
+    results = response.json()["results"]
+    assert [result["status"] for result in results] == [201, 201, 201]
+
+    db = TestingSessionLocal()
+    titles = [
+        db.query(Todos).filter(Todos.id == result["id"]).first().title
+        for result in results
+    ]
+    assert titles == ["Batch todo 0", "Batch todo 1", "Batch todo 2"]
+
+
+def test_create_todos_batch_validates_items():
+    response = client.post(
+        "/Todos:batch",
+        json=[{"title": "ok title", "description": "x", "priority": 9, "complete": 1}],
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+
+
+def test_update_todos_batch(many_todos):
+    db = TestingSessionLocal()
+    mine = db.query(Todos).filter(Todos.owner_id == 1).first()
+    other = db.query(Todos).filter(Todos.owner_id == 2).first()
+    request_data = [
+        {
+            "id": todo_id,
+            "title": "Updated in batch",
+            "description": "Updated in batch",
+            "priority": 1,
+            "complete": True,
+        }
+        for todo_id in (mine.id, other.id)
+    ]
+
+    response = client.patch("/Todos:batch", json=request_data)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["results"] == [
+        {"id": mine.id, "status": 204},
+        {"id": other.id, "status": 404},
+    ]
+    db.expire_all()
+    assert db.query(Todos).filter(Todos.id == mine.id).first().title == "Updated in batch"
+    assert db.query(Todos).filter(Todos.id == other.id).first().title == "Not mine"
+
+
+def test_update_todos_batch_holds_write_lock_while_checking_owners(many_todos):
+    import sqlite3
+    from sqlalchemy import event
+
+    db = TestingSessionLocal()
+    mine = db.query(Todos).filter(Todos.owner_id == 1).first()
+    db.close()
+    blocked = []
+
+    def delete_during_owner_check(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("SELECT todos.id") and not blocked:
+            # A concurrent request deleting the row must wait for this transaction.
+            other = sqlite3.connect("./testdb.db", timeout=0)
+            try:
+                other.execute("DELETE FROM todos WHERE id = ?", (mine.id,))
+                blocked.append(False)
+            except sqlite3.OperationalError:
+                blocked.append(True)
+            finally:
+                other.close()
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", delete_during_owner_check)
+    try:
+        response = client.patch(
+            "/Todos:batch",
+            json=[{"id": mine.id, "title": "Locked update", "description": "Still here", "priority": 1, "complete": True}],
+        )
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", delete_during_owner_check)
+
+    assert blocked == [True]
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"results": [{"id": mine.id, "status": 204}]}
+
+
+def test_delete_todos_batch(many_todos):
+    db = TestingSessionLocal()
+    mine = [todo.id for todo in db.query(Todos).filter(Todos.owner_id == 1).limit(2)]
+    other = db.query(Todos).filter(Todos.owner_id == 2).first().id
+
+    response = client.request("DELETE", "/Todos:batch", json=[*mine, other])
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["results"] == [
+        {"id": mine[0], "status": 204},
+        {"id": mine[1], "status": 204},
+        {"id": other, "status": 404},
+    ]
+    db.expire_all()
+    assert db.query(Todos).filter(Todos.id.in_(mine)).count() == 0
+    assert db.query(Todos).filter(Todos.id == other).count() == 1
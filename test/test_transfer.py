@@ -0,0 +1,126 @@
+import csv
+import io
+import asyncio
+import json
+import transfer
+from routers.todos import get_db, get_current_user
+from fastapi import status
+from .utils import *
+
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_current_user] = override_get_current_user
+
+
+def test_export_ndjson(many_todos):
+    response = client.get("/Todos/export")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert len(rows) == 25
+    assert {row["owner_id"] for row in rows} == {1}
+    assert rows[0]["title"] == "Todo 1"
+    assert rows[0]["complete"] is False
+
+
+def test_export_csv(test_todo):
+    response = client.get("/Todos/export", params={"format": "csv"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-disposition"] == 'attachment; filename="todos.csv"'
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert rows == [
+        {
+            "id": str(test_todo.id),
+            "title": "Learn to code!",
+            "description": "Need to learn everyday!",
+            "priority": "5",
+            "complete": "False",
+            "owner_id": "1",
+        }
+    ]
+
+
+def test_import_ndjson_reports_bad_lines(test_todo):
+    body = "\n".join(
+        [
+            json.dumps({"title": "Imported one", "description": "From a file", "priority": 2, "complete": False}),
+            "",
+            "{not json",
+            json.dumps({"title": "Imported two", "description": "From a file", "priority": 9, "complete": True}),
+            json.dumps({"id": 500, "owner_id": 2, "title": "Imported three", "description": "From a file", "priority": 3, "complete": True}),
+        ]
+    )
+    response = client.post("/Todos/import", content=body.encode())
+    assert response.status_code == status.HTTP_200_OK
+    result = response.json()
+    assert result["imported"] == 2
+    assert [error["line"] for error in result["errors"]] == [3, 4]
+    assert "priority" in result["errors"][1]["detail"]
+
+    db = TestingSessionLocal()
+    imported = db.query(Todos).filter(Todos.title.like("Imported%")).all()
+    assert {todo.owner_id for todo in imported} == {1}
+    assert 500 not in {todo.id for todo in imported}
+
+
+def test_import_reports_unreadable_lines_and_keeps_going(test_todo, monkeypatch):
+    monkeypatch.setattr(transfer, "MAX_IMPORT_LINE", 200)
+    todo = {"title": "Readable", "description": "From a file", "priority": 2, "complete": False}
+    body = b"\n".join(
+        [
+            json.dumps(todo).encode(),
+            b'{"title": "Bad \xff bytes"}',
+            json.dumps({**todo, "description": "x" * 500}).encode(),
+            json.dumps(todo).encode(),
+        ]
+    )
+    response = client.post("/Todos/import", content=body)
+    assert response.status_code == status.HTTP_200_OK
+    result = response.json()
+    assert result["imported"] == 2
+    assert result["errors"] == [
+        {"line": 2, "detail": "Line is not valid UTF-8."},
+        {"line": 3, "detail": "Line is longer than 200 bytes."},
+    ]
+
+
+def test_import_lines_across_chunks(monkeypatch):
+    monkeypatch.setattr(transfer, "MAX_IMPORT_LINE", 8)
+
+    async def chunks():
+        for chunk in (b"ab", b"c\n\xc3", b"\xa9\n0123456", b"789ab", b"c\nend"):
+            yield chunk
+
+    async def collect():
+        return [
+            line if isinstance(line, str) else str(line)
+            async for line in transfer.import_lines(chunks())
+        ]
+
+    assert asyncio.run(collect()) == ["abc\n", "\u00e9\n", "Line is longer than 8 bytes.", "end"]
+
+
+def test_export_import_csv_round_trip(test_todo):
+    db = TestingSessionLocal()
+    db.add(
+        Todos(
+            title="Multi-line",
+            description='Says "hi"\nover two lines',
+            priority=1,
+            complete=True,
+            owner_id=1,
+        )
+    )
+    db.commit()
+    exported = client.get("/Todos/export", params={"format": "csv"}).content
+
+    def chunks():
+        # Split mid-line to exercise incremental parsing.
+        for start in range(0, len(exported), 7):
+            yield exported[start : start + 7]
+
+    response = client.post("/Todos/import", params={"format": "csv"}, content=chunks())
+    assert response.json() == {"imported": 2, "errors": []}
+    copies = db.query(Todos).filter(Todos.title == "Multi-line").all()
+    assert len(copies) == 2
+    assert copies[1].description == 'Says "hi"\nover two lines'
+    assert copies[1].complete is True
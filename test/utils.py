@@ -0,0 +1,134 @@
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlalchemy.orm import sessionmaker
+from db import Base
+from main import app
+from fastapi.testclient import TestClient
+import pytest
+from models import Todos, Users
+from passwords import get_bcrypt_context
+from search import create_search_index, drop_search_index, rebuild_search_index
+from metrics import instrument_engine
+from rendering import warm_templates
+import rate_limit
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./testdb.db"
+
+# Fixtures seed data through a plain synchronous engine; the app under test
+# talks to the same file through its async driver.
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+)
+async_engine = create_async_engine(
+    SQLALCHEMY_DATABASE_URL.replace("sqlite:", "sqlite+aiosqlite:"),
+    poolclass=NullPool,
+)
+
+instrument_engine(async_engine)
+
+# The suite logs in and hits /Todos far faster than any client should;
+# test_rate_limit turns the limits back on where it needs them.
+rate_limit.auth_rate_limit.rate = 0
+rate_limit.user_rate_limit.rate = 0
+
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncTestingSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
+
+Base.metadata.drop_all(bind=engine)
+Base.metadata.create_all(bind=engine)
+with engine.begin() as connection:
+    drop_search_index(connection)
+    create_search_index(connection)
+    rebuild_search_index(connection)
+
+# TestClient is not entered, so run the startup work the pages rely on.
+warm_templates()
+
+
+async def override_get_db():
+    async with AsyncTestingSessionLocal() as db:
+        yield db
+
+
+def override_get_current_user():
+    return {"username": "JohnDoe", "id": 1, "user_role": "admin"}
+
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def test_todo():
+    todo = Todos(
+        title="Learn to code!",
+        description="Need to learn everyday!",
+        priority=5,
+        complete=False,
+        owner_id=1,
+    )
+
+    db = TestingSessionLocal()
+    db.add(todo)
+    db.commit()
+    yield todo
+    with engine.connect() as connection:
+        connection.execute(text("DELETE FROM todos;"))
+        connection.execute(text("DELETE FROM todo_tombstones;"))
+        connection.execute(text("DELETE FROM change_counters;"))
+        connection.commit()
+
+
+@pytest.fixture
+def many_todos():
+    db = TestingSessionLocal()
+    for i in range(1, 26):
+        db.add(
+            Todos(
+                title=f"Todo {i}",
+                description=f"Description {i}",
+                priority=i % 5 + 1,
+                complete=i % 2 == 0,
+                owner_id=1,
+            )
+        )
+    db.add(
+        Todos(
+            title="Not mine",
+            description="Someone else's",
+            priority=1,
+            complete=False,
+            owner_id=2,
+        )
+    )
+    db.commit()
+    db.close()
+    yield
+    with engine.connect() as connection:
+        connection.execute(text("DELETE FROM todos;"))
+        connection.execute(text("DELETE FROM todo_tombstones;"))
+        connection.execute(text("DELETE FROM change_counters;"))
+        connection.commit()
+
+
+@pytest.fixture
+def test_user():
+    user = Users(
+        username="codingwithjohn",
+        email="codingwithjohn@email.com",
+        first_name="John",
+        last_name="Doe",
+        hashed_password=get_bcrypt_context().hash("testpassword"),
+        role="admin",
+        is_active=True,
+    )
+    db = TestingSessionLocal()
+    db.add(user)
+    db.commit()
+    yield user
+    with engine.connect() as connection:
+        connection.execute(text("DELETE FROM users;"))
+        connection.commit()
@@ -0,0 +1,69 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+from settings import get_settings
+
+TOKEN_CACHE_SIZE = get_settings().token_cache_size
+
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class TokenCache:
+    """Bounded LRU of verified bearer tokens -> claims.
+
+    Entries are keyed by a SHA-256 of the token, so raw tokens are never held,
+    and each one expires at the token's own `exp`.
+    """
+
+    def __init__(self, maxsize: int = TOKEN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest: str) -> Optional[dict]:
+        entry = self.entries.get(digest)
+        if entry is None or entry[0] <= time.time():
+            if entry is not None:
+                del self.entries[digest]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(digest)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, digest: str, claims: dict, expires_at: float):
+        self.entries[digest] = (expires_at, claims)
+        self.entries.move_to_end(digest)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def discard(self, digest: str):
+        self.entries.pop(digest, None)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+token_cache = TokenCache()
+
+# Optional revocation hook: called as check(digest, claims) on every request,
+# cached or not; returning True rejects the token.
+revocation_check: Optional[Callable[[str, dict], bool]] = None
+
+
+def set_revocation_check(check: Optional[Callable[[str, dict], bool]]):
+    global revocation_check
+    revocation_check = check
+
+
+def is_revoked(digest: str, claims: dict) -> bool:
+    return revocation_check is not None and revocation_check(digest, claims)
@@ -0,0 +1,123 @@
+import csv
+import io
+import json
+from typing import AsyncIterator, Union
+from pydantic import ValidationError
+
+EXPORT_FIELDS = ["id", "title", "description", "priority", "complete", "owner_id"]
+IMPORT_FIELDS = ["title", "description", "priority", "complete"]
+# Rows fetched per round trip while exporting, and inserted per transaction while importing.
+EXPORT_BATCH_SIZE = 1000
+IMPORT_BATCH_SIZE = 1000
+# A single line longer than this is reported as an error rather than buffered without bound.
+MAX_IMPORT_LINE = 64 * 1024
+MAX_IMPORT_ERRORS = 100
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+async def export_lines(result, format: str) -> AsyncIterator[str]:
+    """Serialises a streamed result one partition at a time, so memory stays
+    bounded by EXPORT_BATCH_SIZE rows whatever the size of the export."""
+    if format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_FIELDS)
+        yield buffer.getvalue()
+    async for partition in result.partitions():
+        buffer = io.StringIO()
+        if format == "csv":
+            writer = csv.writer(buffer)
+            writer.writerows(partition)
+        else:
+            for row in partition:
+                buffer.write(json.dumps(row._asdict()))
+                buffer.write("\n")
+        yield buffer.getvalue()
+
+
+def decode_line(line: bytes):
+    try:
+        return line.decode("utf-8")
+    except UnicodeDecodeError:
+        return ValueError("Line is not valid UTF-8.")
+
+
+async def import_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Union[str, ValueError]]:
+    """Splits an uploaded byte stream into lines as it arrives. A line that is
+    not UTF-8 or is longer than MAX_IMPORT_LINE comes back as a ValueError in
+    its place, so one bad line cannot abort an import that has already
+    committed earlier batches."""
+    pending = b""
+    # Inside an over-long line: its bytes are dropped up to the next newline.
+    skipping = False
+    async for chunk in chunks:
+        *lines, pending = (pending + chunk).split(b"\n")
+        for line in lines:
+            if skipping or len(line) > MAX_IMPORT_LINE:
+                skipping = False
+                yield ValueError(f"Line is longer than {MAX_IMPORT_LINE} bytes.")
+            else:
+                yield decode_line(line + b"\n")
+        if skipping or len(pending) > MAX_IMPORT_LINE:
+            skipping = True
+            pending = b""
+    if skipping:
+        yield ValueError(f"Line is longer than {MAX_IMPORT_LINE} bytes.")
+    elif pending:
+        yield decode_line(pending)
+
+
+async def import_records(lines: AsyncIterator[str], format: str) -> AsyncIterator[tuple[int, object]]:
+    """Yields (line number, raw record) pairs; records are dicts, or the
+    exception raised while reading or parsing that line."""
+    if format == "ndjson":
+        number = 0
+        async for line in lines:
+            number += 1
+            if isinstance(line, Exception):
+                yield number, line
+            elif line.strip():
+                try:
+                    yield number, json.loads(line)
+                except ValueError as exc:
+                    yield number, exc
+        return
+
+    header = None
+    record_lines: list[str] = []
+    number = start = 0
+    async for line in lines:
+        number += 1
+        if isinstance(line, Exception):
+            # Drop the record it belongs to, and report it where that record began.
+            yield (start if record_lines else number), line
+            record_lines = []
+            continue
+        if not record_lines:
+            start = number
+        record_lines.append(line)
+        # A quoted field may span lines; the record is complete once its quotes balance.
+        if sum(part.count('"') for part in record_lines) % 2:
+            continue
+        record = next(csv.reader(record_lines), [])
+        record_lines = []
+        if not record:
+            continue
+        if header is None:
+            header = record
+            continue
+        yield start, dict(zip(header, record))
+    if record_lines:
+        yield start, ValueError("Unterminated quoted field.")
+
+
+def import_error(number: int, exc: Exception) -> dict:
+    if isinstance(exc, ValidationError):
+        detail = "; ".join(
+            f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+            for error in exc.errors()
+        )
+    else:
+        detail = str(exc)
+    return {"line": number, "detail": detail}